@@ -1,6 +1,7 @@
+import os
+import html
 import streamlit as st
-import torch
-from model.model import load_resources, translate
+from model.engine import TranslatorEngine, create_translation_cache
 import base64
 
 # Custom page icon (a professional translation icon)
@@ -535,11 +536,18 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# Load the model and resources (cached to prevent reloading)
+# Load the translation engine (cached to prevent reloading)
 @st.cache_resource
-def load_translation_resources():
+def load_translation_engine():
     try:
-        return load_resources()
+        # Set TRANSLATION_CACHE_DB to keep the translations on disk across restarts,
+        # TRANSLATION_QUANTIZATION to "int8" or "float16" to load a quantized model and
+        # TRANSLATION_SHORTLIST to the vocabulary shortlist to decode with
+        quantization = os.environ.get("TRANSLATION_QUANTIZATION") or None
+        shortlist_path = os.environ.get("TRANSLATION_SHORTLIST") or None
+        cache = create_translation_cache(db_path=os.environ.get("TRANSLATION_CACHE_DB"),
+                                         quantization=quantization, shortlist_path=shortlist_path)
+        return TranslatorEngine.get(cache=cache, quantization=quantization, shortlist_path=shortlist_path)
     except Exception as e:
         st.error(f"Error loading model: {str(e)}")
         return None
@@ -555,10 +563,9 @@ st.markdown("""
 
 # Load resources with a better loading experience
 with st.spinner(""):
-    resources = load_translation_resources()
+    engine = load_translation_engine()
 
-if resources:
-    model, src_tokenizer, tgt_tokenizer, device = resources
+if engine:
     
     # Create columns for input and output
     col1, col2 = st.columns(2)
@@ -577,8 +584,10 @@ if resources:
     with col2:
         st.markdown('<div class="output-container">', unsafe_allow_html=True)
         st.markdown('<div class="output-header">🇬🇧 English Translation</div>', unsafe_allow_html=True)
+        # Placeholder replaced by the partial translation while it is being decoded
+        output_placeholder = st.empty()
         if 'translation' in st.session_state and st.session_state.translation:
-            st.text_area(
+            output_placeholder.text_area(
                 "",
                 value=st.session_state.translation,
                 height=200,
@@ -586,7 +595,7 @@ if resources:
                 label_visibility="collapsed"
             )
         else:
-            st.text_area(
+            output_placeholder.text_area(
                 "",
                 placeholder="Translation will appear here...",
                 height=200,
@@ -611,13 +620,18 @@ if resources:
         st.rerun()
     
     if translate_clicked and arabic_text:
-        with st.spinner("Translating..."):
-            try:
-                english_translation = translate(model, arabic_text, src_tokenizer, tgt_tokenizer, device)
-                st.session_state.translation = english_translation
-                st.rerun()
-            except Exception as e:
-                st.error(f"Translation error: {str(e)}")
+        try:
+            english_translation = ""
+            # Show the words as soon as they are decoded
+            for english_translation in engine.translate_document_stream(arabic_text):
+                output_placeholder.markdown(
+                    f'<div class="result-content" style="white-space: pre-wrap;">{html.escape(english_translation)}</div>',
+                    unsafe_allow_html=True
+                )
+            st.session_state.translation = english_translation
+            st.rerun()
+        except Exception as e:
+            st.error(f"Translation error: {str(e)}")
     
     # Character counter
     if arabic_text:
@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+# Run from the repository root so the model package can be imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from model.config import MAX_LENGTH, QUANTIZATION_MODES
+
+SENTENCES_PATH = os.path.join(ROOT, "benchmarks", "sentences.ar.txt")
+
+# Time to load everything and translate one sentence in a fresh interpreter
+COLD_START = """
+import time
+start = time.perf_counter()
+from model.engine import TranslatorEngine
+engine = TranslatorEngine(compiled={compiled}, quantization={quantization!r}, shortlist_path={shortlist!r})
+loaded = time.perf_counter()
+engine.translate({sentence!r})
+print(loaded - start, time.perf_counter() - start)
+"""
+
+
+def build_inputs(sentences, tokenizer_in, length, count):
+    # count texts of about length subword tokens, made of the words of the corpus in order
+    words = " ".join(sentences).split()
+    texts = []
+    position = 0
+    for _ in range(count):
+        text = []
+        while not text or len(tokenizer_in.encode(" ".join(text))) < length:
+            text.append(words[position % len(words)])
+            position += 1
+        texts.append(" ".join(text))
+    return texts
+
+
+def percentiles(values):
+    values = np.asarray(values) * 1000
+    return {"p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)),
+            "p99_ms": float(np.percentile(values, 99)),
+            "mean_ms": float(values.mean())}
+
+
+def run_case(model, tokenizer_in, tokenizer_out, texts, batch_size, runs, beam_width):
+    from model.model import encode_sentences, predict_batch, beam_search
+    from model.tokenization import get_special_tokens
+
+    sos_token_output, eos_token_output = get_special_tokens(tokenizer_out)
+    stages = {"tokenize": [], "encoder": [], "decoder": [], "detokenize": []}
+    latencies = []
+    n_sentences = 0
+    n_tokens = 0
+    for run in range(runs):
+        start = run * batch_size % len(texts)
+        batch = (texts[start:] + texts)[:batch_size]
+        t0 = time.perf_counter()
+        enc_inputs = encode_sentences(batch, tokenizer_in)
+        t1 = time.perf_counter()
+        # The encoder alone, to split the time of the generation between the stages
+        model.encode(enc_inputs)
+        t2 = time.perf_counter()
+        if beam_width > 1:
+            outputs = beam_search(model, enc_inputs, sos_token_output, eos_token_output, MAX_LENGTH, beam_width=beam_width)
+        else:
+            outputs = predict_batch(model, enc_inputs, sos_token_output, eos_token_output, MAX_LENGTH)
+        t3 = time.perf_counter()
+        for output in outputs:
+            tokenizer_out.decode([i for i in output if i < sos_token_output[0]])
+        t4 = time.perf_counter()
+
+        stages["tokenize"].append(t1 - t0)
+        stages["encoder"].append(t2 - t1)
+        stages["decoder"].append(max(t3 - t2 - (t2 - t1), 0.0))
+        stages["detokenize"].append(t4 - t3)
+        # A translation request: tokenization, generation and detokenization
+        latencies.append((t1 - t0) + (t4 - t2))
+        n_sentences += len(batch)
+        # The sos token is not generated
+        n_tokens += sum(len(output) - 1 for output in outputs)
+
+    total = sum(latencies)
+    return {
+        "latency": percentiles(latencies),
+        "stages_ms": {name: float(np.mean(times)) * 1000 for name, times in stages.items()},
+        "sentences_per_second": n_sentences / total,
+        "tokens_per_second": n_tokens / total
+    }
+
+
+def cold_start(args, sentence):
+    code = COLD_START.format(compiled=not args.no_compile, quantization=args.quantization,
+                             shortlist=args.shortlist, sentence=sentence)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1]}
+    load_seconds, first_translation_seconds = result.stdout.split()[-2:]
+    return {"load_seconds": float(load_seconds), "first_translation_seconds": float(first_translation_seconds)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the latency and throughput of the translation model")
+    parser.add_argument("--sentences", default=SENTENCES_PATH, help="Arabic corpus, one sentence per line")
+    parser.add_argument("--lengths", default="4,8,13", help="Input lengths in subword tokens")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--runs", type=int, default=20, help="Timed batches of every case")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed batches before every case")
+    parser.add_argument("--beam-width", type=int, default=1)
+    parser.add_argument("--no-compile", action="store_true", help="Run the model eagerly")
+    parser.add_argument("--quantization", choices=QUANTIZATION_MODES)
+    parser.add_argument("--shortlist", help="Vocabulary shortlist built by tools/build_shortlist.py")
+    parser.add_argument("--no-cold-start", action="store_true", help="Skip the cold start measure")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.sentences, encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()]
+
+    import tensorflow as tf
+    from model.model import load_resources
+
+    # Same seed every run, so the results of two commits can be compared
+    tf.random.set_seed(0)
+    results = {
+        "environment": {"python": platform.python_version(), "tensorflow": tf.__version__,
+                        "machine": platform.machine(), "cpus": os.cpu_count()},
+        "options": {"compiled": not args.no_compile, "quantization": args.quantization,
+                    "shortlist": args.shortlist, "beam_width": args.beam_width}
+    }
+    if not args.no_cold_start:
+        results["cold_start"] = cold_start(args, sentences[0])
+
+    start = time.perf_counter()
+    model, tokenizer_in, tokenizer_out, _ = load_resources(compiled=not args.no_compile, quantization=args.quantization,
+                                                           shortlist_path=args.shortlist)
+    results["load_seconds"] = time.perf_counter() - start
+
+    results["cases"] = {}
+    for length in [int(n) for n in args.lengths.split(",")]:
+        for batch_size in [int(n) for n in args.batch_sizes.split(",")]:
+            texts = build_inputs(sentences, tokenizer_in, length, max(batch_size, 64))
+            run_case(model, tokenizer_in, tokenizer_out, texts, batch_size, args.warmup, args.beam_width)
+            results["cases"]["length={},batch={}".format(length, batch_size)] = run_case(
+                model, tokenizer_in, tokenizer_out, texts, batch_size, args.runs, args.beam_width)
+    # ru_maxrss is in kilobytes on Linux
+    results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
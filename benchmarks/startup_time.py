@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Run from the repository root so the model package can be imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code measured in a fresh interpreter, printing its wall time and peak RSS
+PROBE = """
+import resource, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+SCENARIOS = {
+    # What a worker imported before: both frameworks
+    "tensorflow+torch": "import tensorflow\nimport torch",
+    # What a worker imports now: TensorFlow only
+    "tensorflow": "import tensorflow",
+    # The model module itself
+    "model.model": "import model.model",
+    # Configuration, cache and segmentation helpers, which must not load TensorFlow
+    "model-light": "import model.config, model.cache, model.segmentation, model.tokenization",
+}
+
+
+def measure(code, runs):
+    times, rss = [], []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", PROBE.format(code=code)],
+                                cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1]}
+        elapsed, maxrss = result.stdout.split()[-2:]
+        times.append(float(elapsed))
+        rss.append(int(maxrss))
+    return {
+        "median_seconds": statistics.median(times),
+        "min_seconds": min(times),
+        "peak_rss_mb": statistics.median(rss) / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold import time and memory of the model stack")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run, all of them by default")
+    args = parser.parse_args()
+
+    results = {name: measure(SCENARIOS[name], args.runs) for name in args.scenario or SCENARIOS}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
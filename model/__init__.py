@@ -0,0 +1,29 @@
+import importlib
+
+# Public names of the package and the module defining them. They are only imported
+# on first use, so model.config, model.cache or model.segmentation can be used
+# without loading TensorFlow.
+_EXPORTS = {
+    "Transformer": "model.model",
+    "CompiledTransformer": "model.model",
+    "load_resources": "model.model",
+    "translate": "model.model",
+    "translate_batch": "model.model",
+    "translate_stream": "model.model",
+    "translate_document": "model.segmentation",
+    "translate_document_stream": "model.segmentation",
+    "translate_documents": "model.segmentation",
+    "TranslationCache": "model.cache",
+    "TranslatorEngine": "model.engine",
+    "LiteTransformer": "model.lite",
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
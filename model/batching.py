@@ -0,0 +1,95 @@
+import asyncio
+
+
+class DynamicBatcher:
+    # Groups the sentences of concurrent requests: the first waiting sentence opens a
+    # batch, which is closed when max_batch sentences are waiting or after max_wait
+    # seconds, and then translated with a single translate_batch call. Up to
+    # concurrency batches are translated at once, one per model replica.
+
+    def __init__(self, translate_batch, max_batch=32, max_wait=0.005, concurrency=1):
+        # translate_batch: blocking callable taking and returning a list of sentences
+        self.translate_batch = translate_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.concurrency = concurrency
+        self.queue = None
+        self.task = None
+        # Batches being translated
+        self.running = set()
+
+    def start(self):
+        # Must be called from the event loop the requests are served on
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for task in list(self.running):
+            task.cancel()
+
+    async def translate(self, sentence):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((sentence, future))
+        return await future
+
+    async def translate_many(self, sentences):
+        # Every sentence joins the shared batches, so one request can share a
+        # forward pass with sentences of other requests
+        return list(await asyncio.gather(*(self.translate(sentence) for sentence in sentences)))
+
+    async def next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            # Take what is already waiting without sleeping
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            # Wait for a free replica first, the next batch keeps growing meanwhile
+            await slots.acquire()
+            batch = await self.next_batch()
+            # Drop the sentences whose request went away meanwhile
+            batch = [(sentence, future) for sentence, future in batch if not future.done()]
+            if not batch:
+                slots.release()
+                continue
+            task = loop.create_task(self.run_batch(batch))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            # Run the model in a thread so the server keeps accepting requests
+            translations = await loop.run_in_executor(None, self.translate_batch,
+                                                      [sentence for sentence, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), translation in zip(batch, translations):
+            if not future.done():
+                future.set_result(translation)
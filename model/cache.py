@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import weakref
+from collections import OrderedDict
+
+# Every LRUCache of the process, see _reset_locks_after_fork
+_lru_caches = weakref.WeakSet()
+
+
+def _reset_locks_after_fork():
+    # A fork made from one thread copies the locks other threads hold at that moment,
+    # and nothing would release them in the child: give every cache a new lock
+    for cache in list(_lru_caches):
+        cache.lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+
+class LRUCache:
+    # Bounded in-memory mapping, the least recently used entries are evicted first
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        _lru_caches.add(self)
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            # Mark the entry as the most recently used
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            # Evict the oldest entries over the limit
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def normalize_text(text):
+    # Collapse the whitespace so trivially different inputs share the same entry
+    return " ".join(text.split())
+
+
+def fingerprint_files(paths):
+    # Hash of the content of the files the translations depend on (weights and tokenizers)
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class TranslationCache:
+    # Translations keyed by normalized text, decoding options and model fingerprint.
+    # Entries live in a bounded LRU and, when db_path is set, in a SQLite file
+    # that survives restarts and can be shared by several processes.
+
+    def __init__(self, fingerprint, max_entries=10000, db_path=None):
+        self.fingerprint = fingerprint
+        self.memory = LRUCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        self.db_lock = threading.Lock()
+        if db_path:
+            db_dir = os.path.dirname(os.path.abspath(db_path))
+            os.makedirs(db_dir, exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            # WAL lets several Streamlit workers read while one writes
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS translations "
+                            "(key TEXT PRIMARY KEY, translation TEXT NOT NULL)")
+            self.db.commit()
+
+    def make_key(self, text, options=()):
+        return "{}|{}|{}".format(self.fingerprint, ",".join(str(o) for o in options), normalize_text(text))
+
+    def get(self, text, options=()):
+        key = self.make_key(text, options)
+        translation = self.memory.get(key)
+        if translation is None and self.db is not None:
+            with self.db_lock:
+                row = self.db.execute("SELECT translation FROM translations WHERE key = ?",
+                                      (key,)).fetchone()
+            if row is not None:
+                # Promote the entry to the memory tier
+                translation = row[0]
+                self.memory.put(key, translation)
+        if translation is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return translation
+
+    def put(self, text, translation, options=()):
+        key = self.make_key(text, options)
+        self.memory.put(key, translation)
+        if self.db is not None:
+            with self.db_lock:
+                self.db.execute("INSERT OR REPLACE INTO translations (key, translation) VALUES (?, ?)",
+                                (key, translation))
+                self.db.commit()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.hits - self.memory.hits,
+            "entries": len(self.memory)
+        }
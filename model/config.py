@@ -0,0 +1,29 @@
+import os
+
+# Set hyperparamters for the model
+D_MODEL = 512 # 512
+N_LAYERS = 4 # 6
+FFN_UNITS = 512 # 2048
+N_HEADS = 8 # 8
+DROPOUT_RATE = 0.1 # 0.1
+MAX_LENGTH = 15  # Adding max length for sequences
+MAX_POSITIONS = 512  # Positions covered by the positional encoding table
+
+# Inference modes besides float32, see model/quantization.py
+QUANTIZATION_MODES = ("int8", "float16")
+
+# Input lengths the compiled inference graphs are traced for
+LENGTH_BUCKETS = (8, 16, 32, 64)
+
+# Words and decoded outputs memoized by each tokenizer
+TOKENIZER_CACHE_ENTRIES = 100000
+
+# Files of the trained model, next to this module
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+WEIGHTS_PATH = os.path.join(MODEL_DIR, 'arabic_to_english_transformer_weights.weights.h5')
+TOKENIZER_INPUTS_PREFIX = os.path.join(MODEL_DIR, 'tokenizer_inputs.subword')
+TOKENIZER_OUTPUTS_PREFIX = os.path.join(MODEL_DIR, 'tokenizer_outputs.subword')
+# Encoder and decoder step graphs exported by tools/export_tflite.py
+LITE_MODEL_PATH = os.path.join(MODEL_DIR, 'transformer.tflite')
+# Page-aligned copy of the weights written by tools/convert_snapshot.py
+SNAPSHOT_PATH = os.path.join(MODEL_DIR, 'transformer.snapshot')
@@ -0,0 +1,102 @@
+import threading
+from model.cache import TranslationCache, fingerprint_files
+from model.config import WEIGHTS_PATH, TOKENIZER_INPUTS_PREFIX, TOKENIZER_OUTPUTS_PREFIX, SNAPSHOT_PATH
+from model.snapshot import WeightSnapshot
+from model.tokenization import get_special_tokens, ensure_model_files
+
+
+def create_translation_cache(db_path=None, max_entries=10000, quantization=None, shortlist_path=None,
+                             snapshot_path=SNAPSHOT_PATH, snapshot=None):
+    # Cache whose entries are tied to the current weights, tokenizers, shortlist and inference mode
+    tokenizer_files = [TOKENIZER_INPUTS_PREFIX + ".subwords", TOKENIZER_OUTPUTS_PREFIX + ".subwords"]
+    shortlist_files = [shortlist_path] if shortlist_path else []
+    owns_snapshot = snapshot is None
+    if owns_snapshot:
+        snapshot = WeightSnapshot.load_current(snapshot_path, WEIGHTS_PATH)
+    if snapshot is not None:
+        # The weights are identified by the snapshot header, they are neither pulled
+        # nor hashed, so a snapshot-only deployment works and startup stays fast
+        fingerprint = fingerprint_files(tokenizer_files + shortlist_files) + "-" + snapshot.fingerprint()
+        if owns_snapshot:
+            snapshot.close()
+    else:
+        ensure_model_files()
+        fingerprint = fingerprint_files([WEIGHTS_PATH] + tokenizer_files + shortlist_files)
+    if quantization is not None:
+        # Quantized models can translate slightly differently
+        fingerprint += "-" + quantization
+    return TranslationCache(fingerprint, max_entries=max_entries, db_path=db_path)
+
+
+class TranslatorEngine:
+    # Owns the transformer, both tokenizers and their special tokens, independently of
+    # any web framework. TranslatorEngine.get() loads one instance per process, which
+    # can be shared by threads: the calls into the model are serialized by a lock.
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, compiled=True, cache=None, quantization=None, shortlist_path=None, tokenizers=None, snapshot=None):
+        # TensorFlow is only loaded when an engine is created
+        from model.model import load_resources
+
+        self.model, self.tokenizer_in, self.tokenizer_out, self.device = load_resources(compiled=compiled,
+                                                                                        quantization=quantization,
+                                                                                        shortlist_path=shortlist_path,
+                                                                                        tokenizers=tokenizers,
+                                                                                        snapshot=snapshot)
+        self.quantization = quantization
+        self.sos_token_input, self.eos_token_input = get_special_tokens(self.tokenizer_in)
+        self.sos_token_output, self.eos_token_output = get_special_tokens(self.tokenizer_out)
+        self.cache = cache
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, **kwargs):
+        # Load the process wide engine on first use
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(**kwargs)
+            return cls._instance
+
+    def translate(self, text, beam_width=1, length_penalty=0.6):
+        from model.model import translate
+
+        with self.lock:
+            return translate(self.model, text, self.tokenizer_in, self.tokenizer_out, self.device,
+                             beam_width=beam_width, length_penalty=length_penalty, cache=self.cache)
+
+    def translate_batch(self, texts, beam_width=1, length_penalty=0.6):
+        from model.model import translate_batch
+
+        with self.lock:
+            return translate_batch(self.model, texts, self.tokenizer_in, self.tokenizer_out, self.device,
+                                   beam_width=beam_width, length_penalty=length_penalty, cache=self.cache)
+
+    def translate_document(self, text, beam_width=1, length_penalty=0.6):
+        from model.segmentation import translate_document
+
+        with self.lock:
+            return translate_document(self.model, text, self.tokenizer_in, self.tokenizer_out, self.device,
+                                      beam_width=beam_width, length_penalty=length_penalty, cache=self.cache)
+
+    def translate_documents(self, texts, beam_width=1, length_penalty=0.6):
+        from model.segmentation import translate_documents
+
+        with self.lock:
+            return translate_documents(self.model, texts, self.tokenizer_in, self.tokenizer_out, self.device,
+                                       beam_width=beam_width, length_penalty=length_penalty, cache=self.cache)
+
+    def translate_document_stream(self, text, beam_width=1, length_penalty=0.6):
+        from model.segmentation import translate_document_stream
+
+        stream = translate_document_stream(self.model, text, self.tokenizer_in, self.tokenizer_out, self.device,
+                                           beam_width=beam_width, length_penalty=length_penalty, cache=self.cache)
+        # Hold the lock for one decoding step at a time, never while the caller
+        # handles a partial translation
+        while True:
+            with self.lock:
+                partial = next(stream, None)
+            if partial is None:
+                return
+            yield partial
@@ -0,0 +1,78 @@
+import re
+import numpy as np
+from model.cache import normalize_text
+from model.config import LITE_MODEL_PATH
+from model.tokenization import get_special_tokens, load_tokenizers
+
+
+def load_interpreter(path, num_threads=None):
+    # The standalone tflite_runtime package is enough, full TensorFlow is only a fallback
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=path, num_threads=num_threads)
+
+
+class LiteTransformer:
+    # Runs the graphs exported by tools/export_tflite.py: an encoder and a decoder step
+    # for one sentence at a time, with the decoder cache kept in numpy arrays
+
+    def __init__(self, path=LITE_MODEL_PATH, num_threads=None):
+        interpreter = load_interpreter(path, num_threads)
+        self.encoder = interpreter.get_signature_runner("encode")
+        self.decoder = interpreter.get_signature_runner("decode_step")
+        inputs = self.decoder.get_input_details()
+        # Every decoder layer has a keys_<i> and a values_<i> cache input
+        self.cache_names = ["padding"] + sorted(name for name in inputs if re.fullmatch(r"(keys|values)_\d+", name))
+        self.cache_specs = {name: (inputs[name]["shape"], inputs[name]["dtype"]) for name in self.cache_names}
+        self.max_length = inputs["padding"]["shape"][1]
+
+    def create_decoder_cache(self):
+        return {name: np.zeros(shape, dtype=dtype) for name, (shape, dtype) in self.cache_specs.items()}
+
+    def generate(self, enc_input, sos_token_output, eos_token_output):
+        # enc_input: the token ids of the sentence with sos and eos
+        memory = self.encoder(enc_inputs=np.asarray([enc_input], dtype=np.int32))
+        cache = self.create_decoder_cache()
+        predicted_id = sos_token_output[0]
+        for step in range(self.max_length):
+            outputs = self.decoder(dec_inputs=np.array([[predicted_id]], dtype=np.int32),
+                                   step=np.array(step, dtype=np.int32),
+                                   **memory,
+                                   **cache)
+            # The highest probability is taken
+            predicted_id = int(np.argmax(outputs["logits"][0, -1]))
+            if predicted_id == eos_token_output[0]:
+                return
+            yield predicted_id
+            cache = {name: outputs[name] for name in self.cache_names}
+
+
+def translate(model, sentence, tokenizer_in, tokenizer_out, device=None, beam_width=1, length_penalty=0.6, cache=None):
+    # Same interface as model.model.translate, greedy decoding only
+    if beam_width > 1:
+        raise ValueError("The TFLite runtime only supports greedy decoding")
+    if cache is not None:
+        predicted_sentence = cache.get(sentence, (beam_width, length_penalty))
+        if predicted_sentence is not None:
+            return predicted_sentence
+        sentence = normalize_text(sentence)
+
+    sos_token_input, eos_token_input = get_special_tokens(tokenizer_in)
+    sos_token_output, eos_token_output = get_special_tokens(tokenizer_out)
+    enc_input = sos_token_input + tokenizer_in.encode(sentence) + eos_token_input
+    output = list(model.generate(enc_input, sos_token_output, eos_token_output))
+    predicted_sentence = tokenizer_out.decode([i for i in output if i < sos_token_output[0]])
+
+    if cache is not None:
+        cache.put(sentence, predicted_sentence, (beam_width, length_penalty))
+
+    return predicted_sentence
+
+
+def load_resources(path=LITE_MODEL_PATH, num_threads=None):
+    # Same return values as model.model.load_resources, without building the Transformer
+    tokenizer_inputs, tokenizer_outputs = load_tokenizers()
+    return LiteTransformer(path, num_threads), tokenizer_inputs, tokenizer_outputs, None
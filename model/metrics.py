@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Most recent spans kept for the Chrome trace
+MAX_TRACE_EVENTS = 100000
+PREFIX = "translation_"
+
+
+class NullSpan:
+    # Context manager returned by a disabled Metrics, it does nothing
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Metrics:
+    # Timing spans, counters and gauges of the translation pipeline. Exported as
+    # Prometheus text and, when tracing, as a Chrome trace (chrome://tracing or
+    # Perfetto). Disabled, span() and increment() return right away.
+
+    def __init__(self, enabled=False, trace=False):
+        self.enabled = enabled or trace
+        self.trace = trace
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        # name -> [count per bucket, total count, total seconds]
+        self.histograms = {}
+        self.events = deque(maxlen=MAX_TRACE_EVENTS)
+        self.origin = time.perf_counter()
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def observe(self, name, start, end):
+        seconds = end - start
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = [[0] * len(BUCKETS), 0, 0.0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += 1
+            histogram[2] += seconds
+            if self.trace:
+                self.events.append({"name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                                    "ts": (start - self.origin) * 1e6, "dur": seconds * 1e6})
+
+    def increment(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append("# TYPE {}{}_total counter".format(PREFIX, name))
+                lines.append("{}{}_total {}".format(PREFIX, name, value))
+            for name, value in sorted(self.gauges.items()):
+                lines.append("# TYPE {}{} gauge".format(PREFIX, name))
+                lines.append("{}{} {}".format(PREFIX, name, value))
+            for name, (buckets, count, total) in sorted(self.histograms.items()):
+                metric = "{}{}_seconds".format(PREFIX, name)
+                lines.append("# TYPE {} histogram".format(metric))
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, buckets):
+                    cumulative += bucket_count
+                    lines.append('{}_bucket{{le="{}"}} {}'.format(metric, bound, cumulative))
+                lines.append('{}_bucket{{le="+Inf"}} {}'.format(metric, count))
+                lines.append("{}_sum {}".format(metric, total))
+                lines.append("{}_count {}".format(metric, count))
+        return "\n".join(lines) + "\n"
+
+    def dump_trace(self, path):
+        with self.lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# Process wide metrics, enabled with TRANSLATION_METRICS=1 or by the server
+metrics = Metrics(enabled=os.environ.get("TRANSLATION_METRICS") == "1")
+
+if hasattr(os, "register_at_fork"):
+    # A forked worker must not inherit the lock held by another thread of its parent
+    os.register_at_fork(after_in_child=lambda: setattr(metrics, "lock", threading.Lock()))
+
+
+def configure(enabled=True, trace=False):
+    # Turn the process wide metrics on or off, the recorded values are kept
+    metrics.enabled = enabled or trace
+    metrics.trace = trace
+    return metrics
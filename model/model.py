@@ -1,57 +1,72 @@
-import os
-os.environ["PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION"] = "python"
-
-import streamlit as st
-import torch
-import os
 from tensorflow.keras import layers
 import numpy as np
 import tensorflow as tf
-import tensorflow_datasets as tfds
-import subprocess
-# Set hyperparamters for the model
-D_MODEL = 512 # 512
-N_LAYERS = 4 # 6
-FFN_UNITS = 512 # 2048
-N_HEADS = 8 # 8
-DROPOUT_RATE = 0.1 # 0.1
-MAX_LENGTH = 15  # Adding max length for sequences
+from model.cache import normalize_text
+from model.metrics import metrics
+from model.config import (D_MODEL, N_LAYERS, FFN_UNITS, N_HEADS, DROPOUT_RATE,
+                          MAX_LENGTH, MAX_POSITIONS, LENGTH_BUCKETS, WEIGHTS_PATH, SNAPSHOT_PATH)
+from model.tokenization import get_special_tokens, ensure_model_files, load_tokenizers
+from model.quantization import quantize_transformer
+from model.shortlist import Shortlist
+from model.snapshot import WeightSnapshot
 
 class PositionalEncoding(layers.Layer):
 
-    def __init__(self):
+    def __init__(self, max_length=MAX_POSITIONS):
         super(PositionalEncoding, self).__init__()
+        # Longest sequence the precomputed encodings cover
+        self.max_length = max_length
     
     def get_angles(self, pos, i, d_model): # pos: (seq_length, 1) i: (1, d_model)
         angles = 1 / np.power(10000., (2*(i//2)) / np.float32(d_model))
         return pos * angles # (seq_length, d_model)
 
-    def call(self, inputs):
-        # input shape batch_size, seq_length, d_model
-        seq_length = inputs.shape.as_list()[-2]
-        d_model = inputs.shape.as_list()[-1]
-        # Calculate the angles given the input
-        angles = self.get_angles(np.arange(seq_length)[:, np.newaxis],
+    def build(self, input_shape):
+        d_model = input_shape[-1]
+        # Calculate the angles for every position up to max_length
+        angles = self.get_angles(np.arange(self.max_length)[:, np.newaxis],
                                  np.arange(d_model)[np.newaxis, :],
                                  d_model)
         # Calculate the positional encodings
         angles[:, 0::2] = np.sin(angles[:, 0::2])
         angles[:, 1::2] = np.cos(angles[:, 1::2])
-        # Expand the encodings with a new dimension
-        pos_encoding = angles[np.newaxis, ...]
-        
-        return inputs + tf.cast(pos_encoding, tf.float32)
+        # Keep the encodings as a constant, outside of any graph being traced
+        with tf.init_scope():
+            self.pos_table = tf.constant(angles[np.newaxis, ...], dtype=self.compute_dtype) # (1, max_length, d_model)
+
+    def check_length(self, seq_length, offset):
+        # A slice past the end of the table would silently be shorter than the inputs
+        end = tf.reduce_max(offset) + seq_length
+        message = ("The input needs more than the {} positions of the positional encoding table, "
+                   "split it with translate_document or raise MAX_POSITIONS").format(self.max_length)
+        if tf.executing_eagerly():
+            if int(end) > self.max_length:
+                raise ValueError(message)
+        else:
+            tf.debugging.assert_less_equal(end, self.max_length, message=message)
+
+    def call(self, inputs, offset=0):
+        # input shape batch_size, seq_length, d_model
+        seq_length = tf.shape(inputs)[-2]
+        self.check_length(seq_length, offset)
+        if getattr(offset, "shape", None) is not None and offset.shape.rank == 1:
+            # offset: (batch_size,), every sequence starts at its own position
+            positions = offset[:, tf.newaxis] + tf.range(seq_length, dtype=offset.dtype) # (batch_size, seq_length)
+            return inputs + tf.gather(self.pos_table[0], positions)
+        # Take the encodings of the positions of the inputs, starting at offset
+        return inputs + self.pos_table[:, offset:offset + seq_length, :]
     
 def scaled_dot_product_attention(queries, keys, values, mask):
     # Calculate the dot product, QK_transpose
     product = tf.matmul(queries, keys, transpose_b=True)
-    # Get the scale factor
-    keys_dim = tf.cast(tf.shape(keys)[-1], tf.float32)
+    # Get the scale factor, in the dtype the model computes in (float32 or float16)
+    keys_dim = tf.cast(tf.shape(keys)[-1], product.dtype)
     # Apply the scale factor to the dot product
     scaled_product = product / tf.math.sqrt(keys_dim)
-    # Apply masking when it is requiered
+    # Apply masking when it is requiered, -1e9 overflows float16 so it uses -1e4
     if mask is not None:
-        scaled_product += (mask * -1e9)
+        large_negative = -1e9 if product.dtype == tf.float32 else -1e4
+        scaled_product += (tf.cast(mask, product.dtype) * large_negative)
     # dot product with Values
     attention = tf.matmul(tf.nn.softmax(scaled_product, axis=-1), values)
     
@@ -62,6 +77,9 @@ class MultiHeadAttention(layers.Layer):
     def __init__(self, n_heads):
         super(MultiHeadAttention, self).__init__()
         self.n_heads = n_heads
+        # Concatenated Q, K and V variables set by fuse_qkv, None until then
+        self.qkv_kernel = None
+        self.qkv_bias = None
         
     def build(self, input_shape):
         self.d_model = input_shape[-1]
@@ -74,6 +92,9 @@ class MultiHeadAttention(layers.Layer):
         self.value_lin = layers.Dense(units=self.d_model)
         # Set the weight matrix for the output of the multi-head attention W0
         self.final_lin = layers.Dense(units=self.d_model)
+        # Create the variables now, the keys and values have the size of the queries
+        for lin in (self.query_lin, self.key_lin, self.value_lin, self.final_lin):
+            lin.build(input_shape)
         
     def split_proj(self, inputs, batch_size): # inputs: (batch_size, seq_length, d_model)
         # Set the dimension of the projections
@@ -85,17 +106,54 @@ class MultiHeadAttention(layers.Layer):
         splited_inputs = tf.reshape(inputs, shape=shape) # (batch_size, seq_length, nb_proj, d_proj)
         return tf.transpose(splited_inputs, perm=[0, 2, 1, 3]) # (batch_size, nb_proj, seq_length, d_proj)
     
-    def call(self, queries, keys, values, mask):
-        # Get the batch size
+    def fuse_qkv(self):
+        # Move the Q, K and V weights into one kernel so self-attention projects them with
+        # a single matmul. The separate variables are released, the fused ones are the only
+        # copy: load the weights before fusing, the files hold the separate layout.
+        if self.qkv_kernel is not None:
+            return
+        if getattr(self.query_lin.dtype_policy, "quantization_mode", None) is not None:
+            # int8 kernels come with per-channel scales, keep the quantized projections
+            return
+        lins = (self.query_lin, self.key_lin, self.value_lin)
+        with tf.init_scope():
+            kernel = tf.concat([lin.kernel for lin in lins], axis=-1) # (d_model, 3 * d_model)
+            bias = tf.concat([lin.bias for lin in lins], axis=-1) # (3 * d_model,)
+            # The variables of a built layer are locked, like Dense.quantize unlock them
+            # to swap the weights
+            self._tracker.unlock()
+            self.qkv_kernel = self.add_weight(name="qkv_kernel", shape=kernel.shape, dtype=kernel.dtype,
+                                              initializer=lambda shape, dtype: kernel)
+            self.qkv_bias = self.add_weight(name="qkv_bias", shape=bias.shape, dtype=bias.dtype,
+                                            initializer=lambda shape, dtype: bias)
+            self._tracker.lock()
+            for lin in lins:
+                # Untracks and frees the variables, the Dense layers are not called anymore
+                del lin._kernel
+                del lin.bias
+
+    def project_qkv(self, inputs):
+        # Self-attention Q, K and V of inputs with the fused weights
+        batch_size = tf.shape(inputs)[0]
+        qkv = tf.matmul(tf.reshape(inputs, (-1, self.d_model)), self.qkv_kernel) + self.qkv_bias
+        qkv = tf.reshape(qkv, (batch_size, -1, 3, self.n_heads, self.d_head)) # (batch_size, seq_length, 3, nb_proj, d_proj)
+        # A single transpose splits Q, K and V between the heads
+        qkv = tf.transpose(qkv, perm=[2, 0, 3, 1, 4]) # (3, batch_size, nb_proj, seq_length, d_proj)
+        return qkv[0], qkv[1], qkv[2]
+
+    def project_queries(self, queries):
+        # Set the Query matrix and split it between the heads
+        return self.split_proj(self.query_lin(queries), tf.shape(queries)[0])
+
+    def project_keys_values(self, keys, values):
+        # Set the Key and Value matrices and split them between the heads
+        batch_size = tf.shape(keys)[0]
+        return (self.split_proj(self.key_lin(keys), batch_size),
+                self.split_proj(self.value_lin(values), batch_size))
+
+    def attend(self, queries, keys, values, mask):
+        # queries, keys and values already projected and split between the heads
         batch_size = tf.shape(queries)[0]
-        # Set the Query, Key and Value matrices
-        queries = self.query_lin(queries)
-        keys = self.key_lin(keys)
-        values = self.value_lin(values)
-        # Split Q, K y V between the heads or projections
-        queries = self.split_proj(queries, batch_size)
-        keys = self.split_proj(keys, batch_size)
-        values = self.split_proj(values, batch_size)
         # Apply the scaled dot product
         attention = scaled_dot_product_attention(queries, keys, values, mask)
         # Get the attention scores
@@ -104,8 +162,28 @@ class MultiHeadAttention(layers.Layer):
         concat_attention = tf.reshape(attention,
                                       shape=(batch_size, -1, self.d_model))
         # Apply W0 to get the output of the multi-head attention
-        outputs = self.final_lin(concat_attention)
+        return self.final_lin(concat_attention)
+
+    def call(self, queries, keys, values, mask, cache=None, step=None):
+        # Set the Query, Key and Value matrices, split between the heads or projections
+        if self.qkv_kernel is not None and queries is keys and keys is values:
+            queries, keys, values = self.project_qkv(queries)
+        else:
+            queries = self.project_queries(queries)
+            keys, values = self.project_keys_values(keys, values)
+        if cache is not None:
+            # Write the keys and values of the new token at position step of the cache,
+            # the slots of the previous steps keep the ones already computed. step is a
+            # scalar or holds the position of every sequence.
+            max_length = tf.shape(cache["keys"])[2]
+            position = tf.reshape(tf.one_hot(step, max_length, dtype=keys.dtype), (-1, 1, max_length, 1))
+            keys = cache["keys"] + position * keys
+            values = cache["values"] + position * values
+            cache = {"keys": keys, "values": values}
+        outputs = self.attend(queries, keys, values, mask)
         
+        if cache is not None:
+            return outputs, cache
         return outputs
     
 class EncoderLayer(layers.Layer):
@@ -132,6 +210,12 @@ class EncoderLayer(layers.Layer):
         self.dropout_2 = layers.Dropout(rate=self.dropout_rate)
         # Layer normalization
         self.norm_2 = layers.LayerNormalization(epsilon=1e-6)
+        # Create the variables of the sublayers without a forward pass
+        self.multi_head_attention.build(input_shape)
+        self.norm_1.build(input_shape)
+        self.ffn1_relu.build(input_shape)
+        self.ffn2.build(tuple(input_shape[:-1]) + (self.FFN_units,))
+        self.norm_2.build(input_shape)
         
     def call(self, inputs, mask, training):
         # Forward pass of the multi-head attention
@@ -174,12 +258,20 @@ class Encoder(layers.Layer):
                                         n_heads,
                                         dropout_rate) 
                            for _ in range(n_layers)]
+
+    def build(self, input_shape): # input_shape: (batch_size, seq_length)
+        # Create every variable of the encoder without a forward pass
+        self.embedding.build(input_shape)
+        outputs_shape = tuple(input_shape) + (self.d_model,)
+        self.pos_encoding.build(outputs_shape)
+        for enc_layer in self.enc_layers:
+            enc_layer.build(outputs_shape)
     
     def call(self, inputs, mask, training):
         # Get the embedding vectors
         outputs = self.embedding(inputs)
         # Scale the embeddings by sqrt of d_model
-        outputs *= tf.math.sqrt(tf.cast(self.d_model, tf.float32))
+        outputs *= tf.math.sqrt(tf.cast(self.d_model, outputs.dtype))
         # Positional encodding
         outputs = self.pos_encoding(outputs)
         outputs = self.dropout(outputs, training=training)
@@ -216,21 +308,44 @@ class DecoderLayer(layers.Layer):
         self.ffn2 = layers.Dense(units=self.d_model)
         self.dropout_3 = layers.Dropout(rate=self.dropout_rate)
         self.norm_3 = layers.LayerNormalization(epsilon=1e-6)
+        # Create the variables of the sublayers without a forward pass
+        for sublayer in (self.multi_head_causal_attention, self.norm_1,
+                         self.multi_head_enc_dec_attention, self.norm_2,
+                         self.ffn1_relu, self.norm_3):
+            sublayer.build(input_shape)
+        self.ffn2.build(tuple(input_shape[:-1]) + (self.FFN_units,))
         
-    def call(self, inputs, enc_outputs, mask_1, mask_2, training):
+    def call(self, inputs, enc_outputs, mask_1, mask_2, training, cache=None, step=None, memory=None):
         # Call the masked causal attention
-        attention = self.multi_head_causal_attention(inputs,
-                                                inputs,
-                                                inputs,
-                                                mask_1)
+        if cache is None:
+            attention = self.multi_head_causal_attention(inputs,
+                                                    inputs,
+                                                    inputs,
+                                                    mask_1)
+        else:
+            # Incremental decoding, inputs only holds the newest token
+            attention, cache = self.multi_head_causal_attention(inputs,
+                                                           inputs,
+                                                           inputs,
+                                                           mask_1,
+                                                           cache=cache,
+                                                           step=step)
         attention = self.dropout_1(attention, training=training)
         # Residual connection and layer normalization
         attention = self.norm_1(attention + inputs)
         # Call the encoder-decoder attention
-        attention_2 = self.multi_head_enc_dec_attention(attention,
-                                                  enc_outputs,
-                                                  enc_outputs,
-                                                  mask_2)
+        if memory is None:
+            attention_2 = self.multi_head_enc_dec_attention(attention,
+                                                      enc_outputs,
+                                                      enc_outputs,
+                                                      mask_2)
+        else:
+            # The keys and values of the encoder outputs were projected once by Transformer.encode
+            enc_dec_attention = self.multi_head_enc_dec_attention
+            attention_2 = enc_dec_attention.attend(enc_dec_attention.project_queries(attention),
+                                                   memory["keys"],
+                                                   memory["values"],
+                                                   mask_2)
         attention_2 = self.dropout_2(attention_2, training=training)
         # Residual connection and layer normalization
         attention_2 = self.norm_2(attention_2 + attention)
@@ -241,6 +356,8 @@ class DecoderLayer(layers.Layer):
         # Residual connection and layer normalization
         outputs = self.norm_3(outputs + attention_2)
         
+        if cache is not None:
+            return outputs, cache
         return outputs
     
 class Decoder(layers.Layer):
@@ -266,23 +383,46 @@ class Decoder(layers.Layer):
                                         n_heads,
                                         dropout_rate) 
                            for _ in range(n_layers)]
+
+    def build(self, input_shape): # input_shape: (batch_size, seq_length)
+        # Create every variable of the decoder without a forward pass
+        self.embedding.build(input_shape)
+        outputs_shape = tuple(input_shape) + (self.d_model,)
+        self.pos_encoding.build(outputs_shape)
+        for dec_layer in self.dec_layers:
+            dec_layer.build(outputs_shape)
     
-    def call(self, inputs, enc_outputs, mask_1, mask_2, training):
+    def call(self, inputs, enc_outputs, mask_1, mask_2, training, cache=None, step=None, memory=None):
         # Get the embedding vectors
         outputs = self.embedding(inputs)
         # Scale by sqrt of d_model
-        outputs *= tf.math.sqrt(tf.cast(self.d_model, tf.float32))
-        # Positional encodding
-        outputs = self.pos_encoding(outputs)
+        outputs *= tf.math.sqrt(tf.cast(self.d_model, outputs.dtype))
+        # Positional encodding, the tokens start at position step when decoding incrementally
+        outputs = self.pos_encoding(outputs, offset=0 if step is None else step)
         outputs = self.dropout(outputs, training=training)
         # Call the stacked layers
+        new_cache = []
         for i in range(self.n_layers):
-            outputs = self.dec_layers[i](outputs,
-                                         enc_outputs,
-                                         mask_1,
-                                         mask_2,
-                                         training=training)
+            if cache is None:
+                outputs = self.dec_layers[i](outputs,
+                                             enc_outputs,
+                                             mask_1,
+                                             mask_2,
+                                             training=training)
+            else:
+                # enc_outputs is None when the encoder memory is given, pass it by keyword
+                outputs, layer_cache = self.dec_layers[i](outputs,
+                                                          enc_outputs=enc_outputs,
+                                                          mask_1=mask_1,
+                                                          mask_2=mask_2,
+                                                          training=training,
+                                                          cache=cache[i],
+                                                          step=step,
+                                                          memory=None if memory is None else memory[i])
+                new_cache.append(layer_cache)
 
+        if cache is not None:
+            return outputs, new_cache
         return outputs
 
 class Transformer(tf.keras.Model):
@@ -297,6 +437,7 @@ class Transformer(tf.keras.Model):
                  dropout_rate,
                  name="transformer"):
         super(Transformer, self).__init__(name=name)
+        self.d_model = d_model
         # Build the encoder
         self.encoder = Encoder(n_layers,
                                FFN_units,
@@ -313,6 +454,14 @@ class Transformer(tf.keras.Model):
                                d_model)
         # build the linear transformation and softmax function
         self.last_linear = layers.Dense(units=vocab_size_dec, name="lin_ouput")
+        # Optional Shortlist of target subwords used when decoding
+        self.shortlist = None
+
+    def build(self, input_shape): # input_shape: (batch_size, seq_length)
+        # Create every variable so the weights can be loaded without running the model first
+        self.encoder.build(input_shape)
+        self.decoder.build(input_shape)
+        self.last_linear.build(tuple(input_shape) + (self.d_model,))
     
     def create_padding_mask(self, seq): #seq: (batch_size, seq_length)
         # Create the mask for padding
@@ -347,76 +496,539 @@ class Transformer(tf.keras.Model):
         outputs = self.last_linear(dec_outputs)
         
         return outputs
+
+    def encode(self, enc_inputs, training=False):
+        # Create the padding mask for the encoder, reused by the encoder-decoder attention
+        enc_mask = self.create_padding_mask(enc_inputs)
+        # Call the encoder
+        enc_outputs = self.encoder(enc_inputs, enc_mask, training=training)
+        # The encoder outputs do not change while decoding, project them to the keys and
+        # values of the encoder-decoder attention of every decoder layer only once
+        layers_memory = []
+        for dec_layer in self.decoder.dec_layers:
+            keys, values = dec_layer.multi_head_enc_dec_attention.project_keys_values(enc_outputs, enc_outputs)
+            layers_memory.append({"keys": keys, "values": values})
+
+        return {"mask": enc_mask, "layers": layers_memory}
+
+    def create_decoder_cache(self, batch_size, max_length):
+        # Keys and values of the causal attention of every decoder layer, one slot per position
+        n_heads = self.decoder.dec_layers[0].n_heads
+        shape = (batch_size, n_heads, max_length, self.decoder.d_model // n_heads)
+        return {
+            # Positions holding a padding token, masked like create_padding_mask does
+            "padding": tf.zeros((batch_size, max_length)),
+            "layers": [{"keys": tf.zeros(shape, dtype=self.compute_dtype),
+                        "values": tf.zeros(shape, dtype=self.compute_dtype)}
+                       for _ in range(self.decoder.n_layers)]
+        }
+
+    def project_output(self, dec_outputs, vocab=None):
+        # Scores of the whole target vocabulary, or of the ids in vocab only
+        if vocab is None:
+            return self.last_linear(dec_outputs)
+        if getattr(self.last_linear.dtype_policy, "quantization_mode", None) is not None:
+            # The int8 kernel cannot be sliced, score everything and keep the vocab
+            return tf.gather(self.last_linear(dec_outputs), vocab, axis=-1)
+        # Only multiply by the columns of the kernel of the ids in vocab
+        kernel = tf.gather(self.last_linear.kernel, vocab, axis=1)
+        bias = tf.gather(self.last_linear.bias, vocab)
+        return tf.tensordot(dec_outputs, kernel, axes=1) + bias
+
+    def decode_step(self, dec_inputs, memory, cache, step, vocab=None):
+        # dec_inputs: (batch_size, 1), the token at position step of every sequence
+        # memory: the encoder mask and projected encoder outputs returned by encode
+        # step: () shared by the batch, or (batch_size,) when the sequences are at different positions
+        # vocab: (vocab_length,) target ids to score, the outputs follow its order
+        step = tf.convert_to_tensor(step, tf.int32)
+        max_length = tf.shape(cache["padding"])[1]
+        # Record if the new token is padding
+        position = tf.one_hot(step, max_length)
+        padding = cache["padding"] + position * tf.cast(tf.math.equal(dec_inputs, 0), tf.float32)
+        # The new token attends to itself and to the previous ones only
+        look_ahead_mask = tf.cast(tf.range(max_length) > step[..., tf.newaxis], tf.float32)
+        dec_mask_1 = tf.maximum(padding, look_ahead_mask)[:, tf.newaxis, tf.newaxis, :]
+        # Call the decoder on the new token only
+        dec_outputs, layers_cache = self.decoder(dec_inputs,
+                                                 enc_outputs=None,
+                                                 mask_1=dec_mask_1,
+                                                 mask_2=memory["mask"],
+                                                 training=False,
+                                                 cache=cache["layers"],
+                                                 step=step,
+                                                 memory=memory["layers"])
+        # Call the Linear and Softmax functions, the scores are always returned in float32
+        outputs = tf.cast(self.project_output(dec_outputs, vocab), tf.float32) # (batch_size, 1, vocab_size_dec or vocab_length)
+
+        return outputs, {"padding": padding, "layers": layers_cache}
     
-def predict(transformer, inp_sentence, tokenizer_in, tokenizer_out, sos_token_input, eos_token_input, sos_token_output, eos_token_output, target_max_len):
+class CompiledTransformer:
+    # Drop-in replacement of the Transformer for predict, predict_batch and beam_search.
+    # The encoder and the decoder step run as graphs with fixed input signatures: the
+    # inputs are padded to the next length bucket, so each graph is traced once per
+    # bucket instead of once per input length.
+
+    def __init__(self, transformer, target_max_len=MAX_LENGTH, buckets=LENGTH_BUCKETS):
+        self.transformer = transformer
+        self.target_max_len = target_max_len
+        self.buckets = tuple(sorted(buckets))
+        self.shortlist = transformer.shortlist
+        dtype = transformer.compute_dtype
+        n_heads = transformer.decoder.dec_layers[0].n_heads
+        d_head = transformer.decoder.d_model // n_heads
+        # Signature of the decoder cache, the batch size is left free
+        cache_spec = tf.nest.map_structure(
+            lambda t: tf.TensorSpec((None,) + tuple(t.shape[1:]), t.dtype),
+            transformer.create_decoder_cache(1, target_max_len)
+        )
+        self.encoders = {}
+        self.decode_steps = {}
+        # Decoder steps with a shortlist, traced on their first use
+        self.shortlist_decode_steps = {}
+        # Decoder steps taking the position of every sequence, for ContinuousScheduler
+        self.row_decode_steps = {}
+        self.row_shortlist_decode_steps = {}
+        for bucket in self.buckets:
+            self.encoders[bucket] = tf.function(
+                lambda enc_inputs: transformer.encode(enc_inputs),
+                input_signature=[tf.TensorSpec((None, bucket), tf.int32)]
+            )
+            # Signature of the encoder memory, the encoder-decoder keys and values of every layer
+            memory_spec = {
+                "mask": tf.TensorSpec((None, 1, 1, bucket), tf.float32),
+                "layers": [{"keys": tf.TensorSpec((None, n_heads, bucket, d_head), dtype),
+                            "values": tf.TensorSpec((None, n_heads, bucket, d_head), dtype)}
+                           for _ in range(transformer.decoder.n_layers)]
+            }
+            self.decode_steps[bucket] = tf.function(
+                lambda dec_inputs, memory, cache, step:
+                    transformer.decode_step(dec_inputs, memory, cache, step),
+                input_signature=[tf.TensorSpec((None, 1), tf.int32),
+                                 memory_spec,
+                                 cache_spec,
+                                 tf.TensorSpec((), tf.int32)]
+            )
+            self.shortlist_decode_steps[bucket] = tf.function(
+                lambda dec_inputs, memory, cache, step, vocab:
+                    transformer.decode_step(dec_inputs, memory, cache, step, vocab),
+                input_signature=[tf.TensorSpec((None, 1), tf.int32),
+                                 memory_spec,
+                                 cache_spec,
+                                 tf.TensorSpec((), tf.int32),
+                                 tf.TensorSpec((None,), tf.int32)]
+            )
+            self.row_decode_steps[bucket] = tf.function(
+                lambda dec_inputs, memory, cache, step:
+                    transformer.decode_step(dec_inputs, memory, cache, step),
+                input_signature=[tf.TensorSpec((None, 1), tf.int32),
+                                 memory_spec,
+                                 cache_spec,
+                                 tf.TensorSpec((None,), tf.int32)]
+            )
+            self.row_shortlist_decode_steps[bucket] = tf.function(
+                lambda dec_inputs, memory, cache, step, vocab:
+                    transformer.decode_step(dec_inputs, memory, cache, step, vocab),
+                input_signature=[tf.TensorSpec((None, 1), tf.int32),
+                                 memory_spec,
+                                 cache_spec,
+                                 tf.TensorSpec((None,), tf.int32),
+                                 tf.TensorSpec((None,), tf.int32)]
+            )
+
+    def warmup(self):
+        # Trace all the graphs at startup instead of on the first requests
+        for bucket in self.buckets:
+            self.encoders[bucket].get_concrete_function()
+            self.decode_steps[bucket].get_concrete_function()
+
+    def get_bucket(self, length):
+        # Smallest bucket that fits the length, None when it is too long for all of them
+        for bucket in self.buckets:
+            if length <= bucket:
+                return bucket
+        return None
+
+    def encode(self, enc_inputs):
+        length = enc_inputs.shape[1]
+        bucket = self.get_bucket(length)
+        if bucket is None:
+            # Too long for the compiled graphs, run eagerly
+            return self.transformer.encode(enc_inputs)
+        # Pad with 0 up to the bucket, the padding mask hides the extra positions
+        enc_inputs = tf.pad(tf.cast(enc_inputs, tf.int32), [[0, 0], [0, bucket - length]])
+        return self.encoders[bucket](enc_inputs)
+
+    def create_decoder_cache(self, batch_size, max_length):
+        return self.transformer.create_decoder_cache(batch_size, max_length)
+
+    def decode_step(self, dec_inputs, memory, cache, step, vocab=None):
+        bucket = memory["mask"].shape[-1]
+        if bucket not in self.decode_steps or cache["padding"].shape[1] != self.target_max_len:
+            return self.transformer.decode_step(dec_inputs, memory, cache, step, vocab)
+        if np.ndim(step) == 1:
+            # Every sequence at its own position
+            if vocab is not None:
+                return self.row_shortlist_decode_steps[bucket](tf.cast(dec_inputs, tf.int32),
+                                                               memory,
+                                                               cache,
+                                                               tf.constant(step, tf.int32),
+                                                               tf.constant(vocab, tf.int32))
+            return self.row_decode_steps[bucket](tf.cast(dec_inputs, tf.int32),
+                                                 memory,
+                                                 cache,
+                                                 tf.constant(step, tf.int32))
+        if vocab is not None:
+            return self.shortlist_decode_steps[bucket](tf.cast(dec_inputs, tf.int32),
+                                                       memory,
+                                                       cache,
+                                                       tf.constant(step, tf.int32),
+                                                       tf.constant(vocab, tf.int32))
+        return self.decode_steps[bucket](tf.cast(dec_inputs, tf.int32),
+                                         memory,
+                                         cache,
+                                         tf.constant(step, tf.int32))
+
+def get_vocab(transformer, enc_inputs):
+    # Target ids the output projection is restricted to, None for the whole vocabulary
+    if transformer.shortlist is None:
+        return None
+    return transformer.shortlist.vocabulary(enc_inputs)
+
+def generate(transformer, inp_sentence, tokenizer_in, tokenizer_out, sos_token_input, eos_token_input, sos_token_output, eos_token_output, target_max_len):
     # Tokenize the input sequence using the tokenizer_in
-    inp_sentence = sos_token_input + tokenizer_in.encode(inp_sentence) + eos_token_input
+    with metrics.span("tokenize"):
+        inp_sentence = sos_token_input + tokenizer_in.encode(inp_sentence) + eos_token_input
     enc_input = tf.expand_dims(inp_sentence, axis=0)
+    metrics.increment("sentences")
+    metrics.increment("tokens_in", len(inp_sentence))
+
+    # The encoder output does not change while decoding, compute it only once
+    with metrics.span("encoder"):
+        memory = transformer.encode(enc_input)
+    # Cache for the keys and values of the already decoded tokens
+    cache = transformer.create_decoder_cache(1, target_max_len)
+    vocab = get_vocab(transformer, inp_sentence)
 
     # Set the initial output sentence to sos
-    out_sentence = sos_token_output
-    # Reshape the output
-    output = tf.expand_dims(out_sentence, axis=0)
+    predicted_id = tf.expand_dims(sos_token_output, axis=0)
 
     # For max target len tokens
-    for _ in range(target_max_len):
-        # Call the transformer and get the logits 
-        predictions = transformer(enc_input, output, training=False) #(1, seq_length, VOCAB_SIZE_ES)
-        # Extract the logists of the next word
-        prediction = predictions[:, -1:, :]
+    for step in range(target_max_len):
+        # Feed only the last token, the previous ones are in the cache
+        with metrics.span("decode_step"):
+            predictions, cache = transformer.decode_step(predicted_id, memory, cache, step, vocab) #(1, 1, VOCAB_SIZE_ES)
         # The highest probability is taken
-        predicted_id = tf.cast(tf.argmax(prediction, axis=-1), tf.int32)
+        predicted_id = tf.cast(tf.argmax(predictions, axis=-1), tf.int32)
+        if vocab is not None:
+            # Map the position in the shortlist back to the target id
+            predicted_id = tf.gather(vocab, predicted_id)
         # Check if it is the eos token
         if predicted_id == eos_token_output:
-            return tf.squeeze(output, axis=0)
-        # Concat the predicted word to the output sequence
-        output = tf.concat([output, predicted_id], axis=-1)
+            metrics.increment("eos")
+            return
+        metrics.increment("tokens_out")
+        # Hand out the predicted word as soon as it is known
+        yield int(predicted_id[0, 0])
+    # Cut at target_max_len before reaching eos
+    metrics.increment("truncated")
+
+def predict(transformer, inp_sentence, tokenizer_in, tokenizer_out, sos_token_input, eos_token_input, sos_token_output, eos_token_output, target_max_len):
+    # The output sequence is sos followed by all the generated words
+    output = sos_token_output + list(generate(transformer, inp_sentence, tokenizer_in, tokenizer_out,
+                                              sos_token_input, eos_token_input,
+                                              sos_token_output, eos_token_output, target_max_len))
+    return tf.constant(output, dtype=tf.int32)
 
-    return tf.squeeze(output, axis=0)
+def generate_batch(transformer, enc_inputs, sos_token_output, eos_token_output, target_max_len):
+    # enc_inputs: (batch_size, seq_length) sentences with sos and eos, padded with 0
+    batch_size = enc_inputs.shape[0]
+    if metrics.enabled:
+        metrics.increment("sentences", batch_size)
+        metrics.increment("tokens_in", int(tf.math.count_nonzero(enc_inputs)))
+    # Encode the whole batch at once
+    with metrics.span("encoder"):
+        memory = transformer.encode(enc_inputs)
+    cache = transformer.create_decoder_cache(batch_size, target_max_len)
+    vocab = get_vocab(transformer, enc_inputs)
+
+    # Every sequence starts with the sos token
+    outputs = [list(sos_token_output) for _ in range(batch_size)]
+    # Position in the input batch of the rows still being decoded
+    active = np.arange(batch_size)
+    predicted_ids = np.full((batch_size, 1), sos_token_output[0], dtype=np.int32)
+
+    # For max target len tokens
+    for step in range(target_max_len):
+        # Feed the last token of every active sequence
+        with metrics.span("decode_step"):
+            predictions, cache = transformer.decode_step(tf.constant(predicted_ids), memory, cache, step, vocab)
+        # The highest probability is taken
+        predicted_ids = tf.argmax(predictions, axis=-1, output_type=tf.int32).numpy() # (n_active, 1)
+        if vocab is not None:
+            predicted_ids = vocab[predicted_ids]
+        finished = predicted_ids[:, 0] == eos_token_output[0]
+        if metrics.enabled:
+            metrics.increment("eos", int(finished.sum()))
+            metrics.increment("tokens_out", int((~finished).sum()))
+        # Concat the predicted words to the sequences that did not reach eos
+        for row, predicted_id in zip(active[~finished], predicted_ids[~finished, 0]):
+            outputs[row].append(int(predicted_id))
+        # Hand out the sequences decoded so far after every step
+        yield outputs
+        if finished.any():
+            # Drop the finished rows so they stop taking part in the next steps
+            keep = np.flatnonzero(~finished)
+            if keep.size == 0:
+                break
+            active = active[keep]
+            predicted_ids = predicted_ids[keep]
+            memory = tf.nest.map_structure(lambda t: tf.gather(t, keep), memory)
+            cache = tf.nest.map_structure(lambda t: tf.gather(t, keep), cache)
+    else:
+        # The rows still active were cut at target_max_len
+        metrics.increment("truncated", len(active))
+
+def predict_batch(transformer, enc_inputs, sos_token_output, eos_token_output, target_max_len):
+    outputs = [list(sos_token_output) for _ in range(enc_inputs.shape[0])]
+    # Run the generation until every sequence is done
+    for outputs in generate_batch(transformer, enc_inputs, sos_token_output, eos_token_output, target_max_len):
+        pass
+    return outputs
+
+def beam_search(transformer, enc_inputs, sos_token_output, eos_token_output, target_max_len, beam_width=4, length_penalty=0.6):
+    # enc_inputs: (batch_size, seq_length), every sentence gets beam_width rows in the decoder batch
+    batch_size = enc_inputs.shape[0]
+    if metrics.enabled:
+        metrics.increment("sentences", batch_size)
+        metrics.increment("tokens_in", int(tf.math.count_nonzero(enc_inputs)))
+    # Encode once and repeat the encoder outputs for the beams of each sentence
+    with metrics.span("encoder"):
+        memory = tf.nest.map_structure(lambda t: tf.repeat(t, beam_width, axis=0),
+                                       transformer.encode(enc_inputs))
+    cache = transformer.create_decoder_cache(batch_size * beam_width, target_max_len)
+    vocab = get_vocab(transformer, enc_inputs)
+
+    # Log probability of every beam, only the first one is alive at the start
+    scores = np.full((batch_size, beam_width), -np.inf, dtype=np.float32)
+    scores[:, 0] = 0.0
+    # Tokens of every beam, without the sos token
+    sequences = np.zeros((batch_size, beam_width, 0), dtype=np.int32)
+    # Hypotheses that reached eos for every sentence, as (normalized score, tokens)
+    hypotheses = [[] for _ in range(batch_size)]
+    truncated = 0
+    # Position in the input batch of the sentences still being decoded
+    active = np.arange(batch_size)
+    predicted_ids = np.full((batch_size * beam_width, 1), sos_token_output[0], dtype=np.int32)
+
+    def normalize(score, length):
+        # GNMT length penalty, so longer hypotheses are not always beaten by shorter ones
+        return score / (((5.0 + length) / 6.0) ** length_penalty)
+
+    # For max target len tokens
+    for step in range(target_max_len):
+        # One forward pass for all the beams of all the active sentences
+        with metrics.span("decode_step"):
+            predictions, cache = transformer.decode_step(tf.constant(predicted_ids), memory, cache, step, vocab)
+        log_probs = tf.nn.log_softmax(predictions[:, -1, :], axis=-1)
+        vocab_size = log_probs.shape[-1]
+        # Score of every continuation of every beam, flattened by sentence
+        candidates = tf.reshape(scores[:, :, np.newaxis] + tf.reshape(log_probs, (len(active), beam_width, vocab_size)),
+                                (len(active), beam_width * vocab_size))
+        # At most beam_width of the best candidates end with eos (one per beam),
+        # so the best 2 * beam_width always hold beam_width beams to continue
+        top_scores, top_indices = tf.math.top_k(candidates, k=2 * beam_width)
+        top_scores = top_scores.numpy()
+        top_beams = top_indices.numpy() // vocab_size
+        top_tokens = top_indices.numpy() % vocab_size
+        if vocab is not None:
+            # Positions in the shortlist to target ids
+            top_tokens = vocab[top_tokens]
+        is_eos = top_tokens == eos_token_output[0]
+
+        # Store the hypotheses ending with eos among the beam_width best candidates
+        for row, rank in zip(*np.nonzero(is_eos[:, :beam_width])):
+            if np.isfinite(top_scores[row, rank]):
+                hypotheses[active[row]].append((normalize(top_scores[row, rank], step + 1),
+                                                sequences[row, top_beams[row, rank]]))
+
+        # Continue with the best candidates that are not eos, in order of score
+        order = np.argsort(is_eos, axis=1, kind="stable")[:, :beam_width]
+        beams = np.take_along_axis(top_beams, order, axis=1)
+        tokens = np.take_along_axis(top_tokens, order, axis=1)
+        scores = np.take_along_axis(top_scores, order, axis=1)
+        sequences = np.concatenate([np.take_along_axis(sequences, beams[:, :, np.newaxis], axis=1),
+                                    tokens[:, :, np.newaxis]], axis=-1)
+        # Rows of the decoder batch the new beams come from
+        rows = (np.arange(len(active))[:, np.newaxis] * beam_width + beams).reshape(-1)
+
+        # A sentence is done when beam_width hypotheses reached eos
+        done = np.array([len(hypotheses[i]) >= beam_width for i in active])
+        if done.all():
+            break
+        if done.any():
+            # Drop the beams of the done sentences from the decoder batch
+            keep = np.flatnonzero(~done)
+            rows = rows.reshape(len(active), beam_width)[keep].reshape(-1)
+            active, scores, sequences, tokens = active[keep], scores[keep], sequences[keep], tokens[keep]
+            memory = tf.nest.map_structure(lambda t: tf.gather(t, rows), memory)
+        cache = tf.nest.map_structure(lambda t: tf.gather(t, rows), cache)
+        predicted_ids = tokens.reshape(-1, 1).astype(np.int32)
+    else:
+        # Sentences that did not finish in time also compete with their live beams
+        truncated = len(active)
+        for row, i in enumerate(active):
+            for beam in range(beam_width):
+                if np.isfinite(scores[row, beam]):
+                    hypotheses[i].append((normalize(scores[row, beam], sequences.shape[-1]),
+                                          sequences[row, beam]))
+
+    # Pick the best hypothesis of every sentence
+    outputs = [list(sos_token_output) + [int(t) for t in max(h, key=lambda x: x[0])[1]]
+               for h in hypotheses]
+    if metrics.enabled:
+        metrics.increment("eos", batch_size - truncated)
+        metrics.increment("truncated", truncated)
+        metrics.increment("tokens_out", sum(len(output) - 1 for output in outputs))
+    return outputs
 
 # Update the translate function to use the model and tokens provided
-def translate(model, sentence, tokenizer_in, tokenizer_out, device=None):
-    # Recalculate tokens
-    num_words_inputs = tokenizer_in.vocab_size + 2
-    sos_token_input = [num_words_inputs - 2]
-    eos_token_input = [num_words_inputs - 1]
+def translate(model, sentence, tokenizer_in, tokenizer_out, device=None, beam_width=1, length_penalty=0.6, cache=None):
+    if cache is not None:
+        # Reuse the translation of the same text with the same decoding options
+        predicted_sentence = cache.get(sentence, (beam_width, length_penalty))
+        if predicted_sentence is not None:
+            return predicted_sentence
+        # Translate the text the cache entry is keyed by
+        sentence = normalize_text(sentence)
 
-    num_words_output = tokenizer_out.vocab_size + 2
-    sos_token_output = [num_words_output - 2]
-    eos_token_output = [num_words_output - 1]
+    # Recalculate tokens
+    sos_token_input, eos_token_input = get_special_tokens(tokenizer_in)
+    sos_token_output, eos_token_output = get_special_tokens(tokenizer_out)
 
     # Get the predicted sequence for the input sentence
-    output = predict(model, sentence, tokenizer_in, tokenizer_out, sos_token_input, eos_token_input, sos_token_output, eos_token_output, MAX_LENGTH).numpy()
+    if beam_width > 1:
+        with metrics.span("tokenize"):
+            enc_input = tf.expand_dims(sos_token_input + tokenizer_in.encode(sentence) + eos_token_input, axis=0)
+        output = beam_search(model, enc_input, sos_token_output, eos_token_output, MAX_LENGTH,
+                             beam_width=beam_width, length_penalty=length_penalty)[0]
+    else:
+        output = predict(model, sentence, tokenizer_in, tokenizer_out, sos_token_input, eos_token_input, sos_token_output, eos_token_output, MAX_LENGTH).numpy()
     
     # Transform the sequence of tokens to a sentence
-    predicted_sentence = tokenizer_out.decode(
-        [i for i in output if i < sos_token_output]
-    )
+    with metrics.span("detokenize"):
+        predicted_sentence = tokenizer_out.decode(
+            [i for i in output if i < sos_token_output[0]]
+        )
+
+    if cache is not None:
+        cache.put(sentence, predicted_sentence, (beam_width, length_penalty))
 
     return predicted_sentence
 
-@st.cache_resource
-def load_resources():
-    # Get the current file's directory
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    model_path = os.path.join(current_dir, 'arabic_to_english_transformer_weights.weights.h5')
+def translate_stream(model, sentence, tokenizer_in, tokenizer_out, device=None, cache=None):
+    # Yield the partial translation every time a new word is decoded
+    if cache is not None:
+        predicted_sentence = cache.get(sentence, (1, 0.6))
+        if predicted_sentence is not None:
+            yield predicted_sentence
+            return
+        sentence = normalize_text(sentence)
 
-    # Ensure Git LFS files are pulled
-    if not os.path.exists(model_path):
-        try:
-            subprocess.run(["git", "lfs", "pull"], check=True)
-        except subprocess.CalledProcessError as e:
-            st.error(f"Error pulling Git LFS files: {e}")
-            return None, None, None, None
+    sos_token_input, eos_token_input = get_special_tokens(tokenizer_in)
+    sos_token_output, eos_token_output = get_special_tokens(tokenizer_out)
 
-    # Load tokenizers
-    tokenizer_inputs = tfds.deprecated.text.SubwordTextEncoder.load_from_file(
-        os.path.join(current_dir, 'tokenizer_inputs.subword')
-    )
-    tokenizer_outputs = tfds.deprecated.text.SubwordTextEncoder.load_from_file(
-        os.path.join(current_dir, 'tokenizer_outputs.subword')
-    )
+    output = []
+    predicted_sentence = ""
+    for predicted_id in generate(model, sentence, tokenizer_in, tokenizer_out, sos_token_input, eos_token_input, sos_token_output, eos_token_output, MAX_LENGTH):
+        output.append(predicted_id)
+        # Decode the whole prefix, subwords only make sense next to their neighbours
+        with metrics.span("detokenize"):
+            predicted_sentence = tokenizer_out.decode([i for i in output if i < sos_token_output[0]])
+        yield predicted_sentence
+
+    if cache is not None:
+        cache.put(sentence, predicted_sentence, (1, 0.6))
+
+def encode_sentences(sentences, tokenizer_in):
+    sos_token_input, eos_token_input = get_special_tokens(tokenizer_in)
+    # Tokenize the input sentences and pad them with 0 to the longest one
+    with metrics.span("tokenize"):
+        inp_sentences = [sos_token_input + tokenizer_in.encode(sentence) + eos_token_input
+                         for sentence in sentences]
+    enc_inputs = np.zeros((len(inp_sentences), max(len(s) for s in inp_sentences)), dtype=np.int32)
+    for i, inp_sentence in enumerate(inp_sentences):
+        enc_inputs[i, :len(inp_sentence)] = inp_sentence
+    return tf.constant(enc_inputs)
+
+def translate_batch(model, sentences, tokenizer_in, tokenizer_out, device=None, beam_width=1, length_penalty=0.6, cache=None):
+    if not sentences:
+        return []
+    if cache is not None:
+        # Only translate the sentences missing from the cache, each distinct one once
+        options = (beam_width, length_penalty)
+        translations = [cache.get(sentence, options) for sentence in sentences]
+        missing = list(dict.fromkeys(normalize_text(sentence)
+                                     for sentence, translation in zip(sentences, translations)
+                                     if translation is None))
+        new_translations = dict(zip(missing, translate_batch(model, missing, tokenizer_in, tokenizer_out, device,
+                                                             beam_width, length_penalty)))
+        for sentence, translation in new_translations.items():
+            cache.put(sentence, translation, options)
+        return [translation if translation is not None else new_translations[normalize_text(sentence)]
+                for sentence, translation in zip(sentences, translations)]
+    sos_token_output, eos_token_output = get_special_tokens(tokenizer_out)
+    enc_inputs = encode_sentences(sentences, tokenizer_in)
+
+    # Get the predicted sequences, in the same order as the input sentences
+    if beam_width > 1:
+        outputs = beam_search(model, enc_inputs, sos_token_output, eos_token_output, MAX_LENGTH,
+                              beam_width=beam_width, length_penalty=length_penalty)
+    else:
+        outputs = predict_batch(model, enc_inputs, sos_token_output, eos_token_output, MAX_LENGTH)
+
+    # Transform the sequences of tokens to sentences
+    with metrics.span("detokenize"):
+        return [tokenizer_out.decode([i for i in output if i < sos_token_output[0]])
+                for output in outputs]
+
+def translate_batch_stream(model, sentences, tokenizer_in, tokenizer_out, device=None, beam_width=1, length_penalty=0.6, cache=None):
+    # Yield the partial translations of all the sentences after every decoding step
+    if beam_width > 1:
+        # Beams are only settled at the end, there is nothing to show before
+        yield translate_batch(model, sentences, tokenizer_in, tokenizer_out, device,
+                              beam_width, length_penalty, cache)
+        return
+    options = (beam_width, length_penalty)
+    translations = [cache.get(sentence, options) if cache is not None else None for sentence in sentences]
+    missing = [i for i, translation in enumerate(translations) if translation is None]
+    if not missing:
+        yield translations
+        return
+    inputs = [normalize_text(sentences[i]) if cache is not None else sentences[i] for i in missing]
+
+    sos_token_output, eos_token_output = get_special_tokens(tokenizer_out)
+    enc_inputs = encode_sentences(inputs, tokenizer_in)
+    for outputs in generate_batch(model, enc_inputs, sos_token_output, eos_token_output, MAX_LENGTH):
+        with metrics.span("detokenize"):
+            for i, output in zip(missing, outputs):
+                translations[i] = tokenizer_out.decode([t for t in output if t < sos_token_output[0]])
+        yield list(translations)
+
+    if cache is not None:
+        for i, sentence in zip(missing, inputs):
+            cache.put(sentence, translations[i], options)
 
+def fuse_qkv_projections(transformer):
+    # Fuse the Q, K and V projections of the encoder self-attention and of the decoder
+    # causal attention. The encoder-decoder attention keeps separate projections, its
+    # queries and keys come from different tensors. The weights of the model then no
+    # longer match the HDF5 file or a snapshot, save them before fusing.
+    for enc_layer in transformer.encoder.enc_layers:
+        enc_layer.multi_head_attention.fuse_qkv()
+    for dec_layer in transformer.decoder.dec_layers:
+        dec_layer.multi_head_causal_attention.fuse_qkv()
+
+def create_transformer(tokenizer_inputs, tokenizer_outputs):
     # Recalculate tokens
     num_words_inputs = tokenizer_inputs.vocab_size + 2
     num_words_output = tokenizer_outputs.vocab_size + 2
@@ -432,15 +1044,60 @@ def load_resources():
         dropout_rate=DROPOUT_RATE
     )
 
-    # Dummy input to build the model
-    dummy_enc_input = tf.ones((1, MAX_LENGTH), dtype=tf.int32)
-    dummy_dec_input = tf.ones((1, MAX_LENGTH), dtype=tf.int32)
-    transformer(dummy_enc_input, dummy_dec_input, training=False)
+    # Create the variables from the input shape, no dummy forward pass is needed
+    transformer.build((None, MAX_LENGTH))
+
+    return transformer
+
+def load_snapshot(snapshot_path=SNAPSHOT_PATH):
+    # The memory-mapped weights written by tools/convert_snapshot.py, None when the file
+    # is missing or was converted from other HDF5 weights
+    return WeightSnapshot.load_current(snapshot_path, WEIGHTS_PATH)
+
+def build_transformer(tokenizer_inputs, tokenizer_outputs, quantization=None, snapshot=None):
+    transformer = create_transformer(tokenizer_inputs, tokenizer_outputs)
+
+    # Load weights, from the snapshot when there is one, it skips parsing the HDF5 file
+    if snapshot is not None:
+        snapshot.assign(transformer)
+    else:
+        transformer.load_weights(WEIGHTS_PATH)
+    if quantization is not None:
+        # Convert the float32 weights to the quantized inference mode
+        transformer = quantize_transformer(transformer, quantization,
+                                           lambda: create_transformer(tokenizer_inputs, tokenizer_outputs))
+    # Convert the self-attention weights to the fused layout
+    fuse_qkv_projections(transformer)
+
+    return transformer
+
+def load_resources(compiled=True, quantization=None, shortlist_path=None, snapshot_path=SNAPSHOT_PATH,
+                   tokenizers=None, snapshot=None):
+    # tokenizers and snapshot can be given already loaded, by the parent of forked workers
+    owns_snapshot = snapshot is None
+    if owns_snapshot:
+        snapshot = load_snapshot(snapshot_path)
+    if snapshot is None:
+        ensure_model_files()
+
+    # Load tokenizers
+    tokenizer_inputs, tokenizer_outputs = tokenizers if tokenizers is not None else load_tokenizers()
+
+    # quantization: None for float32, "int8" or "float16"
+    transformer = build_transformer(tokenizer_inputs, tokenizer_outputs, quantization=quantization, snapshot=snapshot)
+    if snapshot is not None and owns_snapshot:
+        # The variables hold their own copy, unmap the file
+        snapshot.close()
+    if shortlist_path is not None:
+        # Only score the target subwords the inputs are likely to translate to, and eos
+        transformer.shortlist = Shortlist.load(shortlist_path, extra=get_special_tokens(tokenizer_outputs)[1])
 
-    # Load weights
-    transformer.load_weights(model_path)
+    if compiled:
+        # Compile the inference graphs for every length bucket
+        transformer = CompiledTransformer(transformer)
+        transformer.warmup()
 
-    # Set device
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # Set device, the first GPU TensorFlow can use or the CPU
+    device = "/GPU:0" if tf.config.list_physical_devices("GPU") else "/CPU:0"
 
-    return transformer, tokenizer_inputs, tokenizer_outputs, device
\ No newline at end of file
+    return transformer, tokenizer_inputs, tokenizer_outputs, device
@@ -0,0 +1,39 @@
+import numpy as np
+import tensorflow as tf
+from model.config import QUANTIZATION_MODES
+
+
+def quantize_int8(transformer):
+    # Dynamic int8: the kernels of every Dense and Embedding layer are stored as int8
+    # with per-channel scales and the activations are quantized on the fly
+    if not hasattr(transformer, "quantize"):
+        raise RuntimeError("int8 quantization requires Keras 3.3 or newer")
+    transformer.quantize("int8")
+    return transformer
+
+
+def quantize_float16(transformer, create_transformer):
+    # Build a second model whose variables and computations are float16 and copy the
+    # float32 weights into it. create_transformer must build the same architecture.
+    policy = tf.keras.mixed_precision.global_policy()
+    tf.keras.mixed_precision.set_global_policy("float16")
+    try:
+        half_transformer = create_transformer()
+    finally:
+        tf.keras.mixed_precision.set_global_policy(policy)
+    half_transformer.set_weights([weight.astype(np.float16) for weight in transformer.get_weights()])
+    return half_transformer
+
+
+def quantize_transformer(transformer, mode, create_transformer):
+    # Return the transformer, with its weights already loaded, in the given inference mode
+    if mode == "int8":
+        return quantize_int8(transformer)
+    if mode == "float16":
+        return quantize_float16(transformer, create_transformer)
+    raise ValueError("Unknown quantization mode {!r}, expected one of {}".format(mode, QUANTIZATION_MODES))
+
+
+def weights_size(transformer):
+    # Bytes taken by the weights of the model
+    return sum(weight.nbytes for weight in transformer.get_weights())
@@ -0,0 +1,228 @@
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+import tensorflow as tf
+from model.cache import normalize_text
+from model.config import MAX_LENGTH
+from model.metrics import metrics
+from model.model import encode_sentences, get_vocab
+from model.tokenization import get_special_tokens
+
+# Decoding options of the translation cache entries, the scheduler decodes greedily
+CACHE_OPTIONS = (1, 0.6)
+
+
+def pad_memory(memory, length):
+    # Pad the encoder memory to length source positions, the mask hides the new ones
+    extra = length - memory["mask"].shape[-1]
+    if extra <= 0:
+        return memory
+    return {
+        "mask": tf.pad(memory["mask"], [[0, 0], [0, 0], [0, 0], [0, extra]], constant_values=1.0),
+        "layers": [{"keys": tf.pad(layer["keys"], [[0, 0], [0, 0], [0, extra], [0, 0]]),
+                    "values": tf.pad(layer["values"], [[0, 0], [0, 0], [0, extra], [0, 0]])}
+                   for layer in memory["layers"]]
+    }
+
+
+def trim_memory(memory, length):
+    # Keep the first length source positions of the encoder memory
+    if length >= memory["mask"].shape[-1]:
+        return memory
+    return {
+        "mask": memory["mask"][..., :length],
+        "layers": [{"keys": layer["keys"][:, :, :length, :], "values": layer["values"][:, :, :length, :]}
+                   for layer in memory["layers"]]
+    }
+
+
+class ContinuousScheduler:
+    # Iteration level batching of the decoder. The sentences being translated share
+    # one decoder batch: at every step the new sentences are encoded and join it, and
+    # the ones that reached eos or target_max_len leave it, so a short translation never
+    # waits for a long one and a new request never waits for a whole batch. Every row
+    # has its own position, decoder cache and encoder mask.
+    # Greedy decoding only, the model is only used from the scheduler thread.
+
+    def __init__(self, model, tokenizer_in, tokenizer_out, max_batch=32, target_max_len=MAX_LENGTH, cache=None):
+        self.model = model
+        self.tokenizer_in = tokenizer_in
+        self.tokenizer_out = tokenizer_out
+        self.max_batch = max_batch
+        self.target_max_len = target_max_len
+        self.cache = cache
+        self.sos_token_output, self.eos_token_output = get_special_tokens(tokenizer_out)
+        # (sentence, Future) waiting to join the batch, None stops the scheduler
+        self.requests = queue.Queue()
+        self.thread = None
+
+        # State of the rows of the decoder batch
+        self.futures = []
+        self.sentences = []
+        self.outputs = []
+        self.enc_inputs = []
+        self.steps = np.zeros(0, dtype=np.int32)
+        self.predicted_ids = np.zeros((0, 1), dtype=np.int32)
+        self.memory = None
+        self.decoder_cache = None
+        self.vocab = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, sentence):
+        # Future of the translation of one sentence
+        future = Future()
+        if self.cache is not None:
+            translation = self.cache.get(sentence, CACHE_OPTIONS)
+            if translation is not None:
+                future.set_result(translation)
+                return future
+            sentence = normalize_text(sentence)
+        self.requests.put((sentence, future))
+        return future
+
+    def translate(self, sentence):
+        return self.submit(sentence).result()
+
+    def translate_batch(self, sentences):
+        futures = [self.submit(sentence) for sentence in sentences]
+        return [future.result() for future in futures]
+
+    def run(self):
+        while True:
+            # Sleep until a request comes when nothing is being decoded
+            new_requests = [self.requests.get()] if not self.futures else []
+            while len(self.futures) + len(new_requests) < self.max_batch:
+                try:
+                    new_requests.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            if None in new_requests:
+                self.fail_all(RuntimeError("The scheduler was stopped"), new_requests)
+                return
+            if new_requests:
+                try:
+                    self.join(new_requests)
+                except Exception as e:
+                    # Only the new sentences fail, the rows being decoded are untouched
+                    for _, future in new_requests:
+                        if not future.done():
+                            future.set_exception(e)
+                    if not self.futures:
+                        continue
+            try:
+                self.step()
+            except Exception as e:
+                # Fail the sentences being decoded, the scheduler keeps serving
+                self.fail_all(e, [])
+
+    def join(self, new_requests):
+        # Encode the new sentences and append them to the decoder batch
+        sentences = [sentence for sentence, _ in new_requests]
+        enc_inputs = encode_sentences(sentences, self.tokenizer_in)
+        if metrics.enabled:
+            metrics.increment("sentences", len(sentences))
+            metrics.increment("tokens_in", int(tf.math.count_nonzero(enc_inputs)))
+        with metrics.span("encoder"):
+            memory = self.model.encode(enc_inputs)
+        decoder_cache = self.model.create_decoder_cache(len(sentences), self.target_max_len)
+        if self.memory is not None:
+            # Rows with different source lengths share the longest one
+            length = max(memory["mask"].shape[-1], self.memory["mask"].shape[-1])
+            get_bucket = getattr(self.model, "get_bucket", None)
+            if get_bucket is not None:
+                length = get_bucket(length) or length
+            memory = tf.nest.map_structure(lambda a, b: tf.concat([a, b], axis=0),
+                                           pad_memory(self.memory, length), pad_memory(memory, length))
+            decoder_cache = tf.nest.map_structure(lambda a, b: tf.concat([a, b], axis=0),
+                                                  self.decoder_cache, decoder_cache)
+        self.memory = memory
+        self.decoder_cache = decoder_cache
+
+        self.futures += [future for _, future in new_requests]
+        self.sentences += sentences
+        self.outputs += [[] for _ in sentences]
+        self.enc_inputs += [row[row > 0] for row in enc_inputs.numpy()]
+        self.steps = np.concatenate([self.steps, np.zeros(len(sentences), dtype=np.int32)])
+        start_ids = np.full((len(sentences), 1), self.sos_token_output[0], dtype=np.int32)
+        self.predicted_ids = np.concatenate([self.predicted_ids, start_ids])
+        self.update_vocab()
+
+    def update_vocab(self):
+        # The shortlist of the batch is the union over the rows, it changes with them
+        if self.futures:
+            self.vocab = get_vocab(self.model, np.concatenate(self.enc_inputs)[np.newaxis])
+
+    def step(self):
+        # One decoder step for every row, each at its own position
+        with metrics.span("decode_step"):
+            predictions, self.decoder_cache = self.model.decode_step(tf.constant(self.predicted_ids), self.memory,
+                                                                     self.decoder_cache, self.steps, self.vocab)
+        predicted_ids = tf.argmax(predictions, axis=-1, output_type=tf.int32).numpy() # (batch_size, 1)
+        if self.vocab is not None:
+            predicted_ids = self.vocab[predicted_ids]
+        self.steps = self.steps + 1
+        eos = predicted_ids[:, 0] == self.eos_token_output[0]
+        for row in np.flatnonzero(~eos):
+            self.outputs[row].append(int(predicted_ids[row, 0]))
+        # Rows at eos or at target_max_len leave the batch
+        finished = eos | (self.steps >= self.target_max_len)
+        if metrics.enabled:
+            metrics.increment("eos", int(eos.sum()))
+            metrics.increment("truncated", int((finished & ~eos).sum()))
+            metrics.increment("tokens_out", int((~eos).sum()))
+        self.predicted_ids = predicted_ids.astype(np.int32)
+        if finished.any():
+            self.leave(finished)
+
+    def leave(self, finished):
+        with metrics.span("detokenize"):
+            for row in np.flatnonzero(finished):
+                translation = self.tokenizer_out.decode([i for i in self.outputs[row] if i < self.sos_token_output[0]])
+                if self.cache is not None:
+                    self.cache.put(self.sentences[row], translation, CACHE_OPTIONS)
+                if not self.futures[row].done():
+                    self.futures[row].set_result(translation)
+        keep = np.flatnonzero(~finished)
+        self.futures = [self.futures[i] for i in keep]
+        self.sentences = [self.sentences[i] for i in keep]
+        self.outputs = [self.outputs[i] for i in keep]
+        self.enc_inputs = [self.enc_inputs[i] for i in keep]
+        self.steps = self.steps[keep]
+        self.predicted_ids = self.predicted_ids[keep]
+        if keep.size == 0:
+            self.memory = None
+            self.decoder_cache = None
+            self.vocab = None
+            return
+        self.memory = tf.nest.map_structure(lambda t: tf.gather(t, keep), self.memory)
+        # Narrow the memory back to the longest source left, a long sentence does not
+        # make the cross-attention of the whole batch wider once it is done
+        length = max(len(row) for row in self.enc_inputs)
+        get_bucket = getattr(self.model, "get_bucket", None)
+        if get_bucket is not None:
+            length = get_bucket(length) or length
+        self.memory = trim_memory(self.memory, length)
+        self.decoder_cache = tf.nest.map_structure(lambda t: tf.gather(t, keep), self.decoder_cache)
+        self.update_vocab()
+
+    def fail_all(self, error, new_requests):
+        futures = self.futures + [request[1] for request in new_requests if request is not None]
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+        self.futures, self.sentences, self.outputs, self.enc_inputs = [], [], [], []
+        self.steps = np.zeros(0, dtype=np.int32)
+        self.predicted_ids = np.zeros((0, 1), dtype=np.int32)
+        self.memory = None
+        self.decoder_cache = None
+        self.vocab = None
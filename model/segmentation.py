@@ -0,0 +1,133 @@
+import re
+from model.config import MAX_LENGTH
+
+# Whitespace after a sentence end (Arabic or Latin full stop, question or exclamation
+# mark) and line breaks split the text into sentences
+SENTENCE_BOUNDARY = re.compile(r"((?<=[.!?؟])[ \t]+|[ \t]*\n\s*)")
+# Whitespace after an Arabic or Latin comma, semicolon or colon splits a sentence into clauses
+CLAUSE_BOUNDARY = re.compile(r"(?<=[،,؛;:])\s+")
+# Number of chunks translated together
+BATCH_SIZE = 32
+
+
+def split_sentences(text):
+    # Split the text into (sentence, separator) pairs, the separator being the
+    # whitespace that followed the sentence in the text
+    parts = SENTENCE_BOUNDARY.split(text.strip())
+    sentences = parts[0::2]
+    separators = parts[1::2] + [""]
+    return [(sentence.strip(), separator) for sentence, separator in zip(sentences, separators)
+            if sentence.strip()]
+
+
+def split_long_word(word, fits):
+    # Split a word without whitespace (a URL, a run of emoji) into the longest runs of
+    # characters that fit, found by bisection since the token count grows with the prefix
+    pieces = []
+    while word:
+        low, high = 1, len(word)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits(word[:middle]):
+                low = middle
+            else:
+                high = middle - 1
+        # At least one character per piece, even one that does not fit on its own
+        pieces.append(word[:low])
+        word = word[low:]
+    return pieces
+
+
+def split_long_sentence(sentence, tokenizer_in, max_tokens):
+    # Split a sentence with more subword tokens than the model was trained on,
+    # first into clauses, then into groups of words and last into runs of characters
+    def fits(text):
+        return len(tokenizer_in.encode(text)) <= max_tokens
+
+    if fits(sentence):
+        return [sentence]
+    chunks = []
+    for clause in CLAUSE_BOUNDARY.split(sentence):
+        if fits(clause):
+            chunks.append(clause)
+            continue
+        # Greedily pack words, a single word over the limit is split by characters
+        words = []
+        for word in clause.split():
+            if words and not fits(" ".join(words + [word])):
+                chunks.append(" ".join(words))
+                words = []
+            if not words and not fits(word):
+                pieces = split_long_word(word, fits)
+                chunks.extend(pieces[:-1])
+                word = pieces[-1]
+            words.append(word)
+        if words:
+            chunks.append(" ".join(words))
+    return chunks
+
+
+def segment(text, tokenizer_in, max_tokens=MAX_LENGTH - 2):
+    # Split the text into (chunk, separator) pairs short enough for the model,
+    # max_tokens leaves room for the sos and eos tokens
+    segments = []
+    for sentence, separator in split_sentences(text):
+        chunks = split_long_sentence(sentence, tokenizer_in, max_tokens)
+        segments.extend((chunk, " ") for chunk in chunks[:-1])
+        segments.append((chunks[-1], separator))
+    return segments
+
+
+def join_segments(translations, segments):
+    # Reassemble the translated chunks in order, keeping the line breaks of the input
+    text = ""
+    for translation, (_, separator) in zip(translations, segments):
+        text += translation + ("\n" * separator.count("\n") if "\n" in separator else " ")
+    return text.strip()
+
+
+def translate_document(model, text, tokenizer_in, tokenizer_out, device=None, beam_width=1, length_penalty=0.6, cache=None):
+    from model.model import translate_batch
+
+    segments = segment(text, tokenizer_in)
+    chunks = [chunk for chunk, _ in segments]
+    # Translate the chunks in batches
+    translations = []
+    for i in range(0, len(chunks), BATCH_SIZE):
+        translations += translate_batch(model, chunks[i:i + BATCH_SIZE], tokenizer_in, tokenizer_out, device,
+                                        beam_width=beam_width, length_penalty=length_penalty, cache=cache)
+    return join_segments(translations, segments)
+
+
+def translate_documents(model, texts, tokenizer_in, tokenizer_out, device=None, beam_width=1, length_penalty=0.6, cache=None):
+    from model.model import translate_batch
+
+    # Translate several documents, their chunks sharing the same batches
+    segments = [segment(text, tokenizer_in) for text in texts]
+    chunks = [chunk for document in segments for chunk, _ in document]
+    translations = []
+    for i in range(0, len(chunks), BATCH_SIZE):
+        translations += translate_batch(model, chunks[i:i + BATCH_SIZE], tokenizer_in, tokenizer_out, device,
+                                        beam_width=beam_width, length_penalty=length_penalty, cache=cache)
+    # Hand every document its own translated chunks
+    documents = []
+    start = 0
+    for document in segments:
+        documents.append(join_segments(translations[start:start + len(document)], document))
+        start += len(document)
+    return documents
+
+
+def translate_document_stream(model, text, tokenizer_in, tokenizer_out, device=None, beam_width=1, length_penalty=0.6, cache=None):
+    from model.model import translate_batch_stream
+
+    # Yield the partial translation of the document after every decoding step
+    segments = segment(text, tokenizer_in)
+    chunks = [chunk for chunk, _ in segments]
+    translations = []
+    for i in range(0, len(chunks), BATCH_SIZE):
+        partial = []
+        for partial in translate_batch_stream(model, chunks[i:i + BATCH_SIZE], tokenizer_in, tokenizer_out, device,
+                                              beam_width=beam_width, length_penalty=length_penalty, cache=cache):
+            yield join_segments(translations + partial, segments)
+        translations += partial
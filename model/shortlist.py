@@ -0,0 +1,33 @@
+import numpy as np
+
+
+class Shortlist:
+    # Target subwords a sentence can be translated to: the most frequent target subwords
+    # plus the ones that co-occur most with each source subword of the sentence, built
+    # from a parallel corpus by tools/build_shortlist.py. The candidates of every
+    # source id are stored back to back in candidates, from offsets[id] to offsets[id + 1].
+
+    def __init__(self, frequent, offsets, candidates, extra=()):
+        self.frequent = np.asarray(frequent, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int32)
+        self.candidates = np.asarray(candidates, dtype=np.int32)
+        # Ids always kept, such as the eos token
+        self.extra = np.asarray(extra, dtype=np.int32)
+
+    @classmethod
+    def load(cls, path, extra=()):
+        with np.load(path) as data:
+            return cls(data["frequent"], data["offsets"], data["candidates"], extra)
+
+    def save(self, path):
+        np.savez(path, frequent=self.frequent, offsets=self.offsets, candidates=self.candidates)
+
+    def vocabulary(self, enc_inputs):
+        # Sorted target ids allowed for a batch of encoder inputs, the union over all
+        # the sentences so the batch shares one output projection
+        ids = np.unique(np.asarray(enc_inputs))
+        # Padding, sos, eos and ids out of the table have no candidates
+        ids = ids[(ids > 0) & (ids < len(self.offsets) - 1)]
+        parts = [self.frequent, self.extra]
+        parts += [self.candidates[self.offsets[i]:self.offsets[i + 1]] for i in ids]
+        return np.unique(np.concatenate(parts)).astype(np.int32)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+# Flat weight file: a magic string, the byte length of a JSON header, the header, then
+# every array at an offset aligned on ALIGNMENT. The arrays are read straight from a
+# read-only memory map, so loading parses nothing and every process mapping the file
+# shares the same page cache.
+MAGIC = b"ARENSNAP"
+VERSION = 1
+# Page size of the usual platforms, mmap.ALLOCATIONGRANULARITY is 64 KiB on Windows
+ALIGNMENT = max(4096, mmap.ALLOCATIONGRANULARITY)
+PREFIX = struct.Struct("<8sQ")
+
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def source_stamp(path):
+    # Size and modification time of the file a snapshot was converted from, cheap to
+    # check at every start unlike a hash of the weights
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class WeightSnapshot:
+    # Weights of a model in the order of model.weights, the same order as
+    # get_weights and set_weights. Variable names are kept for the error messages
+    # only: Keras numbers them per process, so they are not stable across runs.
+
+    def __init__(self, arrays, names=None, source=None):
+        self.arrays = list(arrays)
+        self.names = list(names) if names is not None else [str(i) for i in range(len(self.arrays))]
+        # source_stamp of the weights file the snapshot was made from
+        self.source = source
+        self.buffer = None
+        # Hash of the header of a loaded snapshot, see fingerprint
+        self.header_digest = None
+
+    @classmethod
+    def from_model(cls, transformer, source=None):
+        weights = transformer.weights
+        return cls([np.asarray(weight) for weight in weights],
+                   [weight.path for weight in weights], source)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = PREFIX.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            buffer.close()
+            raise ValueError("{} is not a weight snapshot".format(path))
+        header_bytes = buffer[PREFIX.size:PREFIX.size + header_length]
+        header = json.loads(header_bytes.decode("utf-8"))
+        if header["version"] != VERSION:
+            buffer.close()
+            raise ValueError("{} is a version {} snapshot, expected version {}".format(
+                path, header["version"], VERSION))
+        # Read-only views of the mapped file, no copy
+        arrays = [np.frombuffer(buffer, dtype=entry["dtype"], count=int(np.prod(entry["shape"])),
+                                offset=entry["offset"]).reshape(entry["shape"])
+                  for entry in header["arrays"]]
+        snapshot = cls(arrays, [entry["name"] for entry in header["arrays"]], header.get("source"))
+        snapshot.buffer = buffer
+        snapshot.header_digest = hashlib.sha256(header_bytes).hexdigest()[:16]
+        return snapshot
+
+    @classmethod
+    def load_current(cls, path, weights_path):
+        # The snapshot at path, None when there is none or when the weights file changed
+        # since the conversion
+        if path is None or not os.path.exists(path):
+            return None
+        snapshot = cls.load(path)
+        if not snapshot.is_current(weights_path):
+            snapshot.close()
+            return None
+        return snapshot
+
+    def save(self, path):
+        entries = [{"name": name, "dtype": array.dtype.str, "shape": list(array.shape), "offset": 0}
+                   for name, array in zip(self.names, self.arrays)]
+        # The header size depends on the offsets, lay them out again until it stops changing
+        header_length = 0
+        while True:
+            offset = align(PREFIX.size + header_length)
+            for entry, array in zip(entries, self.arrays):
+                entry["offset"] = offset
+                offset = align(offset + array.nbytes)
+            header = json.dumps({"version": VERSION, "source": self.source, "arrays": entries}).encode("utf-8")
+            if len(header) == header_length:
+                break
+            header_length = len(header)
+
+        # Write next to the target and rename, a reader never maps a partial file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(PREFIX.pack(MAGIC, header_length))
+            f.write(header)
+            for entry, array in zip(entries, self.arrays):
+                f.seek(entry["offset"])
+                f.write(np.ascontiguousarray(array).tobytes())
+            # Pad the last array to a whole page
+            f.truncate(offset)
+        os.replace(tmp_path, path)
+
+    def is_current(self, weights_path):
+        # False when the weights file changed since the conversion
+        return not os.path.exists(weights_path) or self.source == source_stamp(weights_path)
+
+    def assign(self, transformer):
+        # Copy the weights into the variables of a built transformer
+        weights = transformer.weights
+        if len(weights) != len(self.arrays):
+            raise ValueError("The snapshot holds {} arrays, the model has {} variables".format(
+                len(self.arrays), len(weights)))
+        for weight, name, array in zip(weights, self.names, self.arrays):
+            if tuple(weight.shape) != array.shape:
+                raise ValueError("Shape mismatch for {}: {} in the snapshot, {} in the model".format(
+                    name, array.shape, tuple(weight.shape)))
+            weight.assign(array)
+        return transformer
+
+    def fingerprint(self):
+        # Identifies the weights without reading them: the header holds the layout and the
+        # size and modification time of the weights file the snapshot was converted from
+        return self.header_digest
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays)
+
+    def close(self):
+        # The arrays must not be used after the map is closed
+        self.arrays = []
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
@@ -0,0 +1,227 @@
+import re
+from model.cache import LRUCache
+from model.config import TOKENIZER_CACHE_ENTRIES
+
+# Same encoding as tfds.deprecated.text.SubwordTextEncoder, without TensorFlow.
+# The subwords are kept in a trie stored as one flat dict, so the greedy longest
+# match walks the token once instead of slicing and hashing every candidate length.
+
+# Escape of "_", which marks the end of a word in the subwords
+UNDERSCORE_REPLACEMENT = "\\&undsc"
+# Ids of the 256 bytes follow the ids of the subwords
+NUM_BYTES = 2 ** 8
+HEADER_LINE = "### SubwordTextEncoder"
+METADATA_PREFIX = "### Metadata: "
+# Splits the text into word and non-word tokens, keeping both
+ALL_REGEX = re.compile(r"(\W+)", flags=re.UNICODE)
+ALPHANUM_REGEX = re.compile(r"\W+", flags=re.UNICODE)
+# Trie nodes are numbered, the child of node n by character c is at key n * CHILD_STRIDE + ord(c)
+CHILD_STRIDE = 0x110000
+
+
+def is_mixed_alphanum(token):
+    return len(ALPHANUM_REGEX.sub("", token)) not in {0, len(token)}
+
+
+def read_subwords(path):
+    # The .subwords file written by SubwordTextEncoder.save_to_file: a header, a metadata
+    # line and one quoted subword per line
+    with open(path, "rb") as f:
+        lines = f.read().decode("utf-8").split("\n")
+    if lines[0] != HEADER_LINE:
+        raise ValueError("{} was not written by SubwordTextEncoder.save_to_file".format(path))
+    if lines and lines[-1] == "":
+        lines.pop()
+    return [line[1:-1] for line in lines[2:]]
+
+
+class SubwordTokenizer:
+    # Drop-in replacement of SubwordTextEncoder for encode, decode and vocab_size,
+    # producing the same ids
+
+    def __init__(self, subwords, cache_entries=TOKENIZER_CACHE_ENTRIES):
+        # Frequent words and outputs are tokenized once: the ids of every word (a token
+        # with its "_" suffix) and the texts of decoded ids are memoized, 0 disables it
+        self.token_cache = LRUCache(cache_entries) if cache_entries else None
+        self.decode_cache = LRUCache(cache_entries) if cache_entries else None
+        # Empty subwords are dropped and the last of duplicated subwords wins, as in tfds
+        self.subwords = [s for s in subwords if s]
+        self.subword_to_id = {s: i for i, s in enumerate(self.subwords)}
+        self.byte_offset = len(self.subwords)
+        # Trie of the subwords, terminals maps a node to the id of the subword ending there
+        self.children = {}
+        self.terminals = {}
+        n_nodes = 1
+        for subword, subword_id in self.subword_to_id.items():
+            node = 0
+            for char in subword:
+                key = node * CHILD_STRIDE + ord(char)
+                child = self.children.get(key)
+                if child is None:
+                    child = self.children[key] = n_nodes
+                    n_nodes += 1
+                node = child
+            self.terminals[node] = [subword_id]
+        # The escaped underscore always matches and stands for the "_" byte
+        node = 0
+        for char in UNDERSCORE_REPLACEMENT:
+            key = node * CHILD_STRIDE + ord(char)
+            child = self.children.get(key)
+            if child is None:
+                child = self.children[key] = n_nodes
+                n_nodes += 1
+            node = child
+        self.terminals[node] = [self.byte_offset + ord("_")]
+
+        # Mixed alphanumeric subwords are never split by the tokenizer. tfds tries them in
+        # set order, the longest are tried first here so the result does not depend on it.
+        reserved_tokens = {UNDERSCORE_REPLACEMENT}
+        reserved_tokens.update(s for s in self.subwords if is_mixed_alphanum(s))
+        self.reserved_tokens = reserved_tokens
+        self.reserved_tokens_re = re.compile("(%s)" % "|".join(
+            re.escape(token) for token in sorted(reserved_tokens, key=lambda t: (-len(t), t))))
+
+    @classmethod
+    def load_from_file(cls, filename_prefix):
+        return cls(read_subwords(filename_prefix + ".subwords"))
+
+    @property
+    def vocab_size(self):
+        # Padding, subwords and bytes
+        return 1 + len(self.subwords) + NUM_BYTES
+
+    def tokenize(self, text):
+        tokens = []
+        for substr in self.reserved_tokens_re.split(text):
+            if substr in self.reserved_tokens:
+                tokens.append(substr)
+            else:
+                tokens.extend(ALL_REGEX.split(substr))
+        return [t for t in tokens if t]
+
+    def prepare_tokens(self, tokens):
+        # Escape "_" and mark the tokens followed by a single space with a "_" suffix,
+        # dropping the space
+        prepared = []
+        skip_next = False
+        for token, next_token in zip(tokens, tokens[1:] + [None]):
+            if skip_next:
+                skip_next = False
+                continue
+            if token == UNDERSCORE_REPLACEMENT:
+                # An escape already in the text is encoded as its two halves
+                prepared.append(token[:2].replace("_", UNDERSCORE_REPLACEMENT))
+                token = token[2:]
+            token = token.replace("_", UNDERSCORE_REPLACEMENT)
+            if next_token == " ":
+                token += "_"
+                skip_next = True
+            prepared.append(token)
+        return prepared
+
+    def byte_encode(self, char):
+        if char == "_":
+            return [self.byte_offset + ord(" ")]
+        return [self.byte_offset + b for b in char.encode("utf-8")]
+
+    def token_to_ids(self, token):
+        # Greedy longest match from the start of the token, an unknown character is
+        # encoded byte by byte
+        children = self.children
+        terminals = self.terminals
+        ids = []
+        start = 0
+        length = len(token)
+        while start < length:
+            node = 0
+            match_ids = None
+            match_end = start
+            for end in range(start, length):
+                node = children.get(node * CHILD_STRIDE + ord(token[end]))
+                if node is None:
+                    break
+                if node in terminals:
+                    match_ids = terminals[node]
+                    match_end = end + 1
+            if match_ids is None:
+                ids.extend(self.byte_encode(token[start]))
+                start += 1
+            else:
+                ids.extend(match_ids)
+                start = match_end
+        return ids
+
+    def cached_token_to_ids(self, token):
+        if self.token_cache is None:
+            return self.token_to_ids(token)
+        ids = self.token_cache.get(token)
+        if ids is None:
+            ids = self.token_to_ids(token)
+            self.token_cache.put(token, ids)
+        return ids
+
+    def encode(self, text):
+        ids = []
+        for token in self.prepare_tokens(self.tokenize(text)):
+            ids.extend(self.cached_token_to_ids(token))
+        # Id 0 is padding
+        return [i + 1 for i in ids]
+
+    def encode_batch(self, texts):
+        return [self.encode(text) for text in texts]
+
+    def decode(self, ids):
+        if self.decode_cache is None:
+            return self.decode_ids(ids)
+        key = tuple(int(i) for i in ids)
+        text = self.decode_cache.get(key)
+        if text is None:
+            text = self.decode_ids(key)
+            self.decode_cache.put(key, text)
+        return text
+
+    def decode_ids(self, ids):
+        ids = list(ids)
+        # Strip the trailing padding and go back to 0 based ids
+        while ids and not ids[-1]:
+            ids.pop()
+        pieces = []
+        pending_bytes = bytearray()
+        for i in ids:
+            subword_id = i - 1
+            if subword_id < 0 or subword_id >= self.vocab_size - 1:
+                raise ValueError("Received id %d which is invalid. Ids must be within [0, %d)."
+                                 % (i, self.vocab_size))
+            if subword_id >= self.byte_offset:
+                # Consecutive bytes are decoded together, they can form one character
+                pending_bytes.append(subword_id - self.byte_offset)
+                continue
+            if pending_bytes:
+                pieces.append(pending_bytes.decode("utf-8", "replace"))
+                pending_bytes = bytearray()
+            subword = self.subwords[subword_id]
+            if subword.endswith("_"):
+                pieces.append(subword[:-1])
+                pieces.append(" ")
+            else:
+                pieces.append(subword)
+        if pending_bytes:
+            pieces.append(pending_bytes.decode("utf-8", "replace"))
+        return "".join(pieces)
+
+    def decode_batch(self, ids_batch):
+        return [self.decode(ids) for ids in ids_batch]
+
+    def cache_stats(self):
+        # Hit rates of the word and decoding caches
+        stats = {}
+        for name, cache in (("encode", self.token_cache), ("decode", self.decode_cache)):
+            if cache is not None:
+                lookups = cache.hits + cache.misses
+                stats[name] = {
+                    "hits": cache.hits,
+                    "misses": cache.misses,
+                    "hit_rate": cache.hits / lookups if lookups else 0.0,
+                    "entries": len(cache)
+                }
+        return stats
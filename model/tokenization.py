@@ -0,0 +1,26 @@
+import os
+import subprocess
+from model.config import WEIGHTS_PATH, TOKENIZER_INPUTS_PREFIX, TOKENIZER_OUTPUTS_PREFIX
+from model.subword import SubwordTokenizer
+
+
+def get_special_tokens(tokenizer):
+    # The sos and eos tokens are the two ids after the vocabulary
+    num_words = tokenizer.vocab_size + 2
+    return [num_words - 2], [num_words - 1]
+
+
+def ensure_model_files():
+    # Ensure Git LFS files are pulled
+    if not os.path.exists(WEIGHTS_PATH):
+        try:
+            subprocess.run(["git", "lfs", "pull"], check=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Error pulling Git LFS files: {e}") from e
+
+
+def load_tokenizers():
+    # Native reader of the SubwordTextEncoder files, tensorflow_datasets is not needed
+    tokenizer_inputs = SubwordTokenizer.load_from_file(TOKENIZER_INPUTS_PREFIX)
+    tokenizer_outputs = SubwordTokenizer.load_from_file(TOKENIZER_OUTPUTS_PREFIX)
+    return tokenizer_inputs, tokenizer_outputs
@@ -0,0 +1,239 @@
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import wait
+from model.config import SNAPSHOT_PATH, WEIGHTS_PATH
+from model.snapshot import WeightSnapshot
+from model.tokenization import ensure_model_files, load_tokenizers
+
+# Seconds between two checks that the pool is still open
+MONITOR_INTERVAL = 1.0
+# Longest wait for the translations of one batch, in seconds
+TASK_TIMEOUT = 300.0
+
+
+def worker_main(connection, tokenizers, snapshot, options, threads):
+    # Body of a forked worker. TensorFlow is imported here for the first time: its
+    # thread pools do not survive a fork, so the parent never loads it.
+    import tensorflow as tf
+    from model.engine import TranslatorEngine, create_translation_cache
+
+    # Every worker gets its share of the cores
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    cache = create_translation_cache(db_path=options["cache_db"], quantization=options["quantization"],
+                                     shortlist_path=options["shortlist"], snapshot=snapshot)
+    # The tokenizers and the mapped snapshot are inherited from the parent
+    engine = TranslatorEngine(cache=cache, quantization=options["quantization"],
+                              shortlist_path=options["shortlist"], tokenizers=tokenizers, snapshot=snapshot)
+    # The worker only talks to the parent through its own pipe, it shares no lock
+    # with the other workers
+    pid = os.getpid()
+    connection.send(("ready", pid))
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        task_id, texts, beam_width, length_penalty = task
+        try:
+            translations = engine.translate_batch(texts, beam_width=beam_width, length_penalty=length_penalty)
+        except Exception as e:
+            connection.send(("done", pid, task_id, None, "{}: {}".format(type(e).__name__, e)))
+        else:
+            connection.send(("done", pid, task_id, translations, None))
+
+
+class WorkerPool:
+    # Pre-forked translation workers. The parent loads the tokenizers and maps the
+    # weight snapshot without importing TensorFlow, then forks the workers, which
+    # inherit both copy-on-write and each build their own Transformer. The parent
+    # hands every batch to an idle worker over that worker's pipe and records the
+    # assignment first, so the batch of a worker that dies is always known.
+    # translate_batch has the signature of TranslatorEngine.translate_batch, so the
+    # pool can stand in for an engine in the HTTP server.
+
+    def __init__(self, workers, threads_per_worker=None, quantization=None, shortlist_path=None,
+                 cache_db=None, snapshot_path=SNAPSHOT_PATH):
+        self.tokenizer_in, self.tokenizer_out = load_tokenizers()
+        # The translation caches live in the workers, shared through cache_db if set
+        self.cache = None
+        self.snapshot = WeightSnapshot.load_current(snapshot_path, WEIGHTS_PATH)
+        if self.snapshot is None:
+            ensure_model_files()
+
+        self.options = {"cache_db": cache_db, "quantization": quantization, "shortlist": shortlist_path}
+        self.threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.context = multiprocessing.get_context("fork")
+        self.task_ids = itertools.count()
+        # Guards the state below, shared by the submitting threads and the reader thread
+        self.lock = threading.Lock()
+        # task id -> Future of the translations
+        self.futures = {}
+        # Tasks waiting for an idle worker
+        self.pending = deque()
+        # pid -> task id of the batch sent to the worker
+        self.assigned = {}
+        # Workers that loaded their model, and the ones of them without a batch
+        self.ready = set()
+        self.idle = deque()
+        self.ready_event = threading.Event()
+        self.error = None
+        self.closed = False
+        # pid -> (process, parent end of its pipe)
+        self.processes = {}
+        for _ in range(workers):
+            self.spawn()
+        self.reader = threading.Thread(target=self.read_results, daemon=True)
+        self.reader.start()
+
+    def spawn(self):
+        connection, child_connection = self.context.Pipe()
+        process = self.context.Process(target=worker_main, daemon=True,
+                                       args=(child_connection,
+                                             (self.tokenizer_in, self.tokenizer_out),
+                                             self.snapshot, self.options, self.threads))
+        process.start()
+        # Only the worker holds the other end, the pipe reports EOF once it exits
+        child_connection.close()
+        self.processes[process.pid] = (process, connection)
+
+    @property
+    def workers(self):
+        return len(self.processes)
+
+    def wait_ready(self, timeout=None):
+        # Block until every worker loaded its model
+        if not self.ready_event.wait(timeout):
+            raise TimeoutError("The workers did not load the model in time")
+        if self.error is not None:
+            raise RuntimeError(self.error)
+
+    def submit(self, texts, beam_width=1, length_penalty=0.6):
+        future = Future()
+        with self.lock:
+            if self.error is not None:
+                raise RuntimeError(self.error)
+            task_id = next(self.task_ids)
+            self.futures[task_id] = future
+            self.pending.append((task_id, list(texts), beam_width, length_penalty))
+            self.dispatch()
+        return future
+
+    def translate_batch(self, texts, beam_width=1, length_penalty=0.6, timeout=TASK_TIMEOUT):
+        if not texts:
+            return []
+        future = self.submit(texts, beam_width, length_penalty)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # Forget the batch, its translations are dropped if they come later
+            with self.lock:
+                for task_id, task_future in list(self.futures.items()):
+                    if task_future is future:
+                        del self.futures[task_id]
+            raise
+
+    def dispatch(self):
+        # Hand the waiting tasks to the idle workers, called with self.lock held
+        while self.pending and self.idle:
+            pid = self.idle.popleft()
+            task = self.pending.popleft()
+            # Recorded before sending, the batch fails if the worker dies from now on
+            self.assigned[pid] = task[0]
+            try:
+                self.processes[pid][1].send(task)
+            except (OSError, ValueError):
+                # The worker is gone, the reader thread fails the batch and replaces it
+                pass
+
+    def read_results(self):
+        while not self.closed:
+            # Wake up on a message or on the exit of a worker
+            with self.lock:
+                pids = {}
+                for pid, (process, connection) in self.processes.items():
+                    pids[connection] = pid
+                    pids[process.sentinel] = pid
+            for pid in set(pids[ready] for ready in wait(list(pids), timeout=MONITOR_INTERVAL)):
+                process, connection = self.processes[pid]
+                try:
+                    while connection.poll():
+                        self.handle(connection.recv())
+                except (EOFError, OSError):
+                    pass
+                if not process.is_alive() and not self.closed:
+                    self.replace(pid)
+
+    def handle(self, message):
+        kind, pid = message[:2]
+        future = None
+        with self.lock:
+            if kind == "ready":
+                self.ready.add(pid)
+                if len(self.ready) >= len(self.processes):
+                    self.ready_event.set()
+            else:
+                _, _, task_id, translations, error = message
+                self.assigned.pop(pid, None)
+                future = self.futures.pop(task_id, None)
+            # The worker can take the next batch
+            self.idle.append(pid)
+            self.dispatch()
+        if future is not None:
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(translations)
+
+    def replace(self, pid):
+        with self.lock:
+            process, connection = self.processes.pop(pid)
+            connection.close()
+            if pid in self.idle:
+                self.idle.remove(pid)
+            future = self.futures.pop(self.assigned.pop(pid, None), None)
+            loaded = pid in self.ready
+            self.ready.discard(pid)
+        if future is not None:
+            future.set_exception(RuntimeError("Worker {} exited with code {}".format(pid, process.exitcode)))
+        if not loaded:
+            # The model could not be loaded, a new worker would fail the same way
+            self.fail("Worker {} exited with code {} while loading the model".format(pid, process.exitcode))
+            return
+        # Start a new worker, it takes batches once it reports ready
+        with self.lock:
+            self.ready_event.clear()
+            self.spawn()
+
+    def fail(self, error):
+        with self.lock:
+            self.error = error
+            futures = list(self.futures.values())
+            self.futures.clear()
+            self.pending.clear()
+        for future in futures:
+            future.set_exception(RuntimeError(error))
+        self.ready_event.set()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            processes = list(self.processes.values())
+        for process, connection in processes:
+            try:
+                connection.send(None)
+            except (OSError, ValueError):
+                pass
+        for process, connection in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            connection.close()
+        if self.snapshot is not None:
+            self.snapshot.close()
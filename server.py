@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import os
+from model.batching import DynamicBatcher
+from model.config import QUANTIZATION_MODES
+from model.engine import TranslatorEngine, create_translation_cache
+from model.metrics import configure, metrics
+from model.segmentation import segment, join_segments
+from model.workers import WorkerPool
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 1 << 20
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+
+class TranslationServer:
+    # Minimal HTTP/1.1 JSON service: every request is split into chunks the model can
+    # translate, and the chunks of all the requests in flight share the batches of
+    # a DynamicBatcher. engine is a TranslatorEngine or a WorkerPool, which translates
+    # as many batches at once as it has workers.
+
+    # With a ContinuousScheduler, the chunks join its decoder batch one by one instead.
+
+    def __init__(self, engine, max_batch=32, max_wait=0.005, scheduler=None):
+        self.engine = engine
+        self.scheduler = scheduler
+        self.batcher = DynamicBatcher(engine.translate_batch, max_batch=max_batch, max_wait=max_wait,
+                                      concurrency=getattr(engine, "workers", 1))
+
+    async def translate_chunks(self, chunks):
+        if self.scheduler is not None:
+            return list(await asyncio.gather(*(asyncio.wrap_future(self.scheduler.submit(chunk))
+                                               for chunk in chunks)))
+        return await self.batcher.translate_many(chunks)
+
+    async def translate_text(self, text):
+        segments = segment(text, self.engine.tokenizer_in)
+        if not segments:
+            return ""
+        translations = await self.translate_chunks([chunk for chunk, _ in segments])
+        return join_segments(translations, segments)
+
+    async def route(self, method, path, body):
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return {"status": "ok"}
+        if path == "/metrics":
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return self.metrics_text()
+        if path not in ("/translate", "/translate/batch"):
+            raise HTTPError(404, "Unknown path")
+        if method != "POST":
+            raise HTTPError(405, "Use POST")
+        try:
+            payload = json.loads(body.decode("utf-8"))
+        except ValueError:
+            raise HTTPError(400, "The body must be JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "The body must be a JSON object")
+
+        if path == "/translate":
+            text = payload.get("text")
+            if not isinstance(text, str):
+                raise HTTPError(400, "'text' must be a string")
+            return {"translation": await self.translate_text(text)}
+
+        texts = payload.get("texts")
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise HTTPError(400, "'texts' must be a list of strings")
+        translations = await asyncio.gather(*(self.translate_text(text) for text in texts))
+        return {"translations": list(translations)}
+
+    def metrics_text(self):
+        # Prometheus exposition of the pipeline metrics and of the cache hit rates
+        for name, stats in self.engine.tokenizer_in.cache_stats().items():
+            metrics.set_gauge("tokenizer_{}_cache_hit_rate".format(name), stats["hit_rate"])
+        for name, stats in self.engine.tokenizer_out.cache_stats().items():
+            metrics.set_gauge("detokenizer_{}_cache_hit_rate".format(name), stats["hit_rate"])
+        if self.engine.cache is not None:
+            stats = self.engine.cache.stats()
+            lookups = stats["hits"] + stats["misses"]
+            metrics.set_gauge("cache_hit_rate", stats["hits"] / lookups if lookups else 0.0)
+            metrics.set_gauge("cache_entries", stats["entries"])
+        return metrics.prometheus_text()
+
+    async def read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HTTPError(400, "Malformed request line")
+        method, target, _ = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise HTTPError(413, "The body is too large")
+        body = await reader.readexactly(length) if length > 0 else b""
+        # Ignore the query string
+        return method, target.split("?", 1)[0], body
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, path, body = await self.read_request(reader)
+                status, payload = 200, await self.route(method, path, body)
+            except HTTPError as e:
+                status, payload = e.status, {"error": str(e)}
+            except asyncio.IncompleteReadError:
+                return
+            except Exception as e:
+                status, payload = 500, {"error": str(e)}
+            # One request per connection keeps the protocol handling small
+            if isinstance(payload, str):
+                content_type = "text/plain; version=0.0.4"
+                data = payload.encode("utf-8")
+            else:
+                content_type = "application/json"
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            writer.write("HTTP/1.1 {} {}\r\nContent-Type: {}; charset=utf-8\r\n"
+                         "Content-Length: {}\r\nConnection: close\r\n\r\n"
+                         .format(status, REASONS[status], content_type, len(data)).encode("latin-1") + data)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        if self.scheduler is not None:
+            self.scheduler.start()
+        else:
+            self.batcher.start()
+        server = await asyncio.start_server(self.handle, host, port)
+        print("Serving on http://{}:{}".format(host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.stop()
+            await self.batcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arabic to English translation HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=32,
+                        help="Largest number of chunks translated in one forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="How long a batch waits for more requests before it runs")
+    parser.add_argument("--quantization", choices=QUANTIZATION_MODES,
+                        help="Load a quantized model instead of the float32 one")
+    parser.add_argument("--shortlist", help="Vocabulary shortlist built by tools/build_shortlist.py")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Forked processes, each holding its own model, 1 translates in the server process")
+    parser.add_argument("--threads-per-worker", type=int,
+                        help="TensorFlow threads of every worker, the cores divided by the workers by default")
+    parser.add_argument("--continuous", action="store_true",
+                        help="Decode with a continuous batching scheduler: sentences join and leave the decoder "
+                             "batch at every step, up to --max-batch-size rows (greedy decoding, one process)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Record stage timings and counters, exported on GET /metrics")
+    parser.add_argument("--trace", help="Also record every span and write them as a Chrome trace to this file on exit")
+    args = parser.parse_args()
+    if args.continuous and args.workers > 1:
+        parser.error("--continuous runs in the server process, it cannot be used with --workers")
+    if args.metrics or args.trace:
+        configure(enabled=True, trace=args.trace is not None)
+
+    if args.workers > 1:
+        # The workers load TensorFlow, the server process only segments and batches
+        engine = WorkerPool(args.workers, threads_per_worker=args.threads_per_worker, quantization=args.quantization,
+                            shortlist_path=args.shortlist, cache_db=os.environ.get("TRANSLATION_CACHE_DB"))
+        engine.wait_ready()
+    else:
+        # Same persistent translation cache as the Streamlit app
+        cache = create_translation_cache(db_path=os.environ.get("TRANSLATION_CACHE_DB"),
+                                         quantization=args.quantization, shortlist_path=args.shortlist)
+        engine = TranslatorEngine.get(cache=cache, quantization=args.quantization, shortlist_path=args.shortlist)
+    scheduler = None
+    if args.continuous:
+        from model.scheduler import ContinuousScheduler
+
+        # Only the scheduler thread uses the model
+        scheduler = ContinuousScheduler(engine.model, engine.tokenizer_in, engine.tokenizer_out,
+                                        max_batch=args.max_batch_size, cache=engine.cache)
+    server = TranslationServer(engine, max_batch=args.max_batch_size, max_wait=args.max_wait_ms / 1000,
+                               scheduler=scheduler)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.workers > 1:
+            engine.close()
+        if args.trace:
+            metrics.dump_trace(args.trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import os
+import sys
+from collections import Counter, defaultdict
+
+# Run from the repository root so the model package can be imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from model.shortlist import Shortlist
+from model.tokenization import load_tokenizers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the target vocabulary shortlist from a parallel corpus")
+    parser.add_argument("corpus", help="UTF-8 file with one 'arabic<TAB>english' pair per line")
+    parser.add_argument("output", help="Shortlist file to write (.npz)")
+    parser.add_argument("--frequent", type=int, default=200,
+                        help="Most frequent target subwords always kept")
+    parser.add_argument("--per-source", type=int, default=50,
+                        help="Target subwords kept for every source subword")
+    args = parser.parse_args()
+
+    tokenizer_in, tokenizer_out = load_tokenizers()
+    # Sentences each source subword and target pair of subwords appear together in
+    cooccurrences = defaultdict(Counter)
+    target_counts = Counter()
+    with open(args.corpus, encoding="utf-8") as f:
+        for line in f:
+            source, _, target = line.rstrip("\n").partition("\t")
+            if not source or not target:
+                continue
+            target_ids = set(tokenizer_out.encode(target))
+            target_counts.update(target_ids)
+            for source_id in set(tokenizer_in.encode(source)):
+                cooccurrences[source_id].update(target_ids)
+
+    frequent = [i for i, _ in target_counts.most_common(args.frequent)]
+    # Lay the candidates of every source id back to back
+    offsets = np.zeros(tokenizer_in.vocab_size + 1, dtype=np.int32)
+    candidates = []
+    for source_id in range(tokenizer_in.vocab_size):
+        candidates += sorted(i for i, _ in cooccurrences[source_id].most_common(args.per_source))
+        offsets[source_id + 1] = len(candidates)
+    shortlist = Shortlist(frequent, offsets, candidates)
+    shortlist.save(args.output)
+
+    sizes = np.diff(offsets)
+    print("{} frequent target subwords, {:.1f} candidates per source subword on average"
+          .format(len(frequent), sizes[sizes > 0].mean() if sizes.any() else 0.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# Run from the repository root so the model package can be imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from model.config import QUANTIZATION_MODES, MAX_LENGTH
+from model.model import CompiledTransformer, build_transformer, encode_sentences, predict_batch
+from model.quantization import weights_size
+from model.tokenization import ensure_model_files, get_special_tokens, load_tokenizers
+
+SENTENCES_PATH = os.path.join(ROOT, "benchmarks", "sentences.ar.txt")
+
+
+def run(transformer, enc_inputs, sos_token_output, eos_token_output, batch_size):
+    # Greedy outputs of every sentence and the time taken to decode them
+    start = time.perf_counter()
+    outputs = []
+    for i in range(0, enc_inputs.shape[0], batch_size):
+        outputs += predict_batch(transformer, enc_inputs[i:i + batch_size], sos_token_output, eos_token_output, MAX_LENGTH)
+    return outputs, time.perf_counter() - start
+
+
+def token_agreement(reference, candidate):
+    # Share of the positions where both outputs have the same token
+    same = sum(1 for a, b in zip(reference, candidate) if a == b)
+    return same / max(len(reference), len(candidate))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the translations of a quantized model with the float32 model")
+    parser.add_argument("mode", choices=QUANTIZATION_MODES)
+    parser.add_argument("--sentences", default=SENTENCES_PATH, help="Held-out Arabic sentences, one per line")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--min-exact-match", type=float, default=0.0,
+                        help="Exit with an error when fewer translations are identical")
+    args = parser.parse_args()
+
+    with open(args.sentences, encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()]
+
+    ensure_model_files()
+    tokenizer_in, tokenizer_out = load_tokenizers()
+    sos_token_output, eos_token_output = get_special_tokens(tokenizer_out)
+    enc_inputs = encode_sentences(sentences, tokenizer_in)
+
+    results = {}
+    outputs = {}
+    for mode in (None, args.mode):
+        transformer = build_transformer(tokenizer_in, tokenizer_out, quantization=mode)
+        compiled = CompiledTransformer(transformer)
+        compiled.warmup()
+        outputs[mode], seconds = run(compiled, enc_inputs, sos_token_output, eos_token_output, args.batch_size)
+        # Every output starts with the sos token, which is not generated
+        n_tokens = sum(len(output) - 1 for output in outputs[mode])
+        results[mode or "float32"] = {
+            "weights_mb": weights_size(transformer) / 2 ** 20,
+            "seconds": seconds,
+            "tokens_per_second": n_tokens / seconds
+        }
+
+    reference, candidate = outputs[None], outputs[args.mode]
+    exact_match = sum(1 for a, b in zip(reference, candidate) if a == b) / len(sentences)
+    results["agreement"] = {
+        "sentences": len(sentences),
+        "exact_match": exact_match,
+        "token_agreement": sum(token_agreement(a, b) for a, b in zip(reference, candidate)) / len(sentences),
+        # A few of the differences, to read them side by side
+        "examples": [{"source": sentence,
+                      "float32": tokenizer_out.decode([t for t in a if t < sos_token_output[0]]),
+                      args.mode: tokenizer_out.decode([t for t in b if t < sos_token_output[0]])}
+                     for sentence, a, b in zip(sentences, reference, candidate) if a != b][:5]
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if exact_match < args.min_exact_match:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
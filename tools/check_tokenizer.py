@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# Run from the repository root so the model package can be imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from model.config import TOKENIZER_INPUTS_PREFIX, TOKENIZER_OUTPUTS_PREFIX
+from model.subword import SubwordTokenizer
+
+SENTENCES_PATH = os.path.join(ROOT, "benchmarks", "sentences.ar.txt")
+# Texts exercising the escaping, the spaces and the byte fallback
+EDGE_CASES = ["", " ", "  double  spaces  ", "snake_case_name", "\\&undsc", "a \\&undsc b",
+              "tabs\tand\nnewlines", "123abc", "emoji 😀", "مرحبا_بك"]
+
+
+def timed(function, items):
+    start = time.perf_counter()
+    results = [function(item) for item in items]
+    return results, time.perf_counter() - start
+
+
+def compare(prefix, texts):
+    # tensorflow_datasets is only needed for this check
+    import tensorflow_datasets as tfds
+
+    reference = tfds.deprecated.text.SubwordTextEncoder.load_from_file(prefix)
+    native = SubwordTokenizer.load_from_file(prefix)
+    reference_ids, reference_seconds = timed(reference.encode, texts)
+    native_ids, native_seconds = timed(native.encode, texts)
+    mismatches = [text for text, a, b in zip(texts, reference_ids, native_ids) if a != b]
+    reference_texts, reference_decode_seconds = timed(reference.decode, reference_ids)
+    native_texts, native_decode_seconds = timed(native.decode, reference_ids)
+    mismatches += [text for text, a, b in zip(texts, reference_texts, native_texts) if a != b]
+    return {
+        "vocab_size": [reference.vocab_size, native.vocab_size],
+        "mismatches": mismatches[:10],
+        "encode_speedup": reference_seconds / native_seconds,
+        "decode_speedup": reference_decode_seconds / native_decode_seconds
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the native tokenizer gives the same ids as SubwordTextEncoder")
+    parser.add_argument("--sentences", default=SENTENCES_PATH, help="Texts to encode, one per line")
+    args = parser.parse_args()
+
+    with open(args.sentences, encoding="utf-8") as f:
+        texts = [line.rstrip("\n") for line in f] + EDGE_CASES
+    results = {
+        "inputs": compare(TOKENIZER_INPUTS_PREFIX, texts),
+        "outputs": compare(TOKENIZER_OUTPUTS_PREFIX, texts)
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if any(result["mismatches"] or result["vocab_size"][0] != result["vocab_size"][1]
+           for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+import time
+
+# Run from the repository root so the model package can be imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from model.config import SNAPSHOT_PATH, WEIGHTS_PATH
+from model.model import create_transformer
+from model.snapshot import WeightSnapshot, source_stamp
+from model.tokenization import ensure_model_files, load_tokenizers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the HDF5 weights to a memory-mapped snapshot")
+    parser.add_argument("--output", default=SNAPSHOT_PATH)
+    parser.add_argument("--no-check", action="store_true",
+                        help="Skip loading the snapshot back and comparing it with the HDF5 weights")
+    args = parser.parse_args()
+
+    ensure_model_files()
+    tokenizer_in, tokenizer_out = load_tokenizers()
+    # The float32 weights in the layout of the HDF5 file, the snapshot is quantized and
+    # its self-attention fused at load time like the HDF5 file
+    transformer = create_transformer(tokenizer_in, tokenizer_out)
+    transformer.load_weights(WEIGHTS_PATH)
+    snapshot = WeightSnapshot.from_model(transformer, source=source_stamp(WEIGHTS_PATH))
+    snapshot.save(args.output)
+    print("Wrote {} ({:.1f} MB, {} arrays)".format(args.output, os.path.getsize(args.output) / 2 ** 20,
+                                                    len(snapshot.arrays)))
+
+    if not args.no_check:
+        # A fresh model loaded from the snapshot must hold the same weights
+        start = time.perf_counter()
+        loaded = WeightSnapshot.load(args.output)
+        copy = loaded.assign(create_transformer(tokenizer_in, tokenizer_out))
+        seconds = time.perf_counter() - start
+        if any((a != b).any() for a, b in zip(transformer.get_weights(), copy.get_weights())):
+            sys.exit("The snapshot does not match the HDF5 weights")
+        loaded.close()
+        print("Checked, built and loaded in {:.2f}s".format(seconds))
+
+
+if __name__ == "__main__":
+    main()
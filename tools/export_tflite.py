@@ -0,0 +1,104 @@
+import argparse
+import os
+import sys
+import tempfile
+
+# Run from the repository root so the model package can be imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import tensorflow as tf
+from model.config import LITE_MODEL_PATH, MAX_LENGTH
+from model.model import build_transformer
+from model.tokenization import ensure_model_files, load_tokenizers
+
+
+def flatten_layers(prefix, layers_state):
+    # [{"keys", "values"}, ...] -> {prefix + "keys_0", prefix + "values_0", ...}
+    flat = {}
+    for i, layer in enumerate(layers_state):
+        flat["{}keys_{}".format(prefix, i)] = layer["keys"]
+        flat["{}values_{}".format(prefix, i)] = layer["values"]
+    return flat
+
+
+def unflatten_layers(prefix, flat, n_layers):
+    return [{"keys": flat["{}keys_{}".format(prefix, i)], "values": flat["{}values_{}".format(prefix, i)]}
+            for i in range(n_layers)]
+
+
+class ExportModule(tf.Module):
+    # Encoder and single decoder step with flat, named inputs and outputs, for one
+    # sentence at a time. The runtime only sees tensors, so the encoder memory and the
+    # decoder cache are passed as mask, enc_keys_<i>, enc_values_<i>, padding,
+    # keys_<i> and values_<i>.
+
+    def __init__(self, transformer, target_max_len):
+        super(ExportModule, self).__init__()
+        self.transformer = transformer
+        self.n_layers = transformer.decoder.n_layers
+        n_heads = transformer.decoder.dec_layers[0].n_heads
+        d_head = transformer.decoder.d_model // n_heads
+        dtype = transformer.compute_dtype
+
+        def spec(name, shape, dtype=tf.float32):
+            return tf.TensorSpec(shape, dtype, name=name)
+
+        # The input length is left free, the runtime resizes the inputs
+        memory_spec = {"mask": spec("mask", (1, 1, 1, None))}
+        cache_spec = {"padding": spec("padding", (1, target_max_len))}
+        for i in range(self.n_layers):
+            for name in ("enc_keys_{}".format(i), "enc_values_{}".format(i)):
+                memory_spec[name] = spec(name, (1, n_heads, None, d_head), dtype)
+            for name in ("keys_{}".format(i), "values_{}".format(i)):
+                cache_spec[name] = spec(name, (1, n_heads, target_max_len, d_head), dtype)
+
+        self.encode = tf.function(self.encode_fn,
+                                  input_signature=[spec("enc_inputs", (1, None), tf.int32)])
+        self.decode_step = tf.function(self.decode_step_fn,
+                                       input_signature=[spec("dec_inputs", (1, 1), tf.int32),
+                                                        memory_spec,
+                                                        cache_spec,
+                                                        spec("step", (), tf.int32)])
+
+    def encode_fn(self, enc_inputs):
+        memory = self.transformer.encode(enc_inputs)
+        return dict(mask=memory["mask"], **flatten_layers("enc_", memory["layers"]))
+
+    def decode_step_fn(self, dec_inputs, memory, cache, step):
+        memory = {"mask": memory["mask"], "layers": unflatten_layers("enc_", memory, self.n_layers)}
+        cache = {"padding": cache["padding"], "layers": unflatten_layers("", cache, self.n_layers)}
+        logits, cache = self.transformer.decode_step(dec_inputs, memory, cache, step)
+        return dict(logits=logits, padding=cache["padding"], **flatten_layers("", cache["layers"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the encoder and the decoder step to a TFLite model")
+    parser.add_argument("--output", default=LITE_MODEL_PATH)
+    parser.add_argument("--optimize", action="store_true",
+                        help="Store the weights as int8 (TFLite dynamic range quantization)")
+    args = parser.parse_args()
+
+    ensure_model_files()
+    tokenizer_in, tokenizer_out = load_tokenizers()
+    module = ExportModule(build_transformer(tokenizer_in, tokenizer_out), MAX_LENGTH)
+
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        # Both graphs go to one file, each under its own signature
+        tf.saved_model.save(module, saved_model_dir, signatures={
+            "encode": module.encode.get_concrete_function(),
+            "decode_step": module.decode_step.get_concrete_function()
+        })
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir,
+                                                             signature_keys=["encode", "decode_step"])
+        if args.optimize:
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        lite_model = converter.convert()
+
+    with open(args.output, "wb") as f:
+        f.write(lite_model)
+    print("Wrote {} ({:.1f} MB)".format(args.output, len(lite_model) / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+
+# Run from the repository root so the model package can be imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from model.config import QUANTIZATION_MODES
+from model.engine import TranslatorEngine, create_translation_cache
+
+# Engine of the current process, loaded by init_worker
+engine = None
+
+
+def init_worker(options, threads):
+    global engine
+    if threads:
+        # Keep the workers from oversubscribing the cores
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    cache = create_translation_cache(db_path=options["cache_db"], quantization=options["quantization"],
+                                     shortlist_path=options["shortlist"])
+    engine = TranslatorEngine.get(cache=cache, quantization=options["quantization"],
+                                  shortlist_path=options["shortlist"])
+
+
+def translate_texts(texts, beam_width):
+    return engine.translate_documents(texts, beam_width=beam_width)
+
+
+def read_text(line, args):
+    # Text to translate of one input line
+    if args.format == "tsv":
+        columns = line.split("\t")
+        return columns[args.column] if args.column < len(columns) else ""
+    if args.format == "jsonl":
+        if not line.strip():
+            return ""
+        return json.loads(line).get(args.field) or ""
+    return line
+
+
+def write_line(line, translation, args):
+    # Output line of one input line, always a single line
+    if args.format == "tsv":
+        return "{}\t{}\n".format(line, translation.replace("\t", " ").replace("\n", " "))
+    if args.format == "jsonl":
+        record = json.loads(line) if line.strip() else {}
+        record[args.output_field] = translation
+        return json.dumps(record, ensure_ascii=False) + "\n"
+    return translation.replace("\n", " ") + "\n"
+
+
+def count_complete_lines(path):
+    # Lines already written, a last line cut by an interruption is removed
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    end = 0
+    size = 0
+    with open(path, "rb+") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            count += chunk.count(b"\n")
+            last = chunk.rfind(b"\n")
+            if last >= 0:
+                end = size + last + 1
+            size += len(chunk)
+        if end < size:
+            f.truncate(end)
+    return count
+
+
+def batches(lines, batch_size):
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate an Arabic file line by line")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--format", choices=["txt", "tsv", "jsonl"],
+                        help="Input format, guessed from the extension by default")
+    parser.add_argument("--column", type=int, default=0, help="TSV column to translate")
+    parser.add_argument("--field", default="text", help="JSONL field to translate")
+    parser.add_argument("--output-field", default="translation", help="JSONL field the translation is written to")
+    parser.add_argument("--batch-size", type=int, default=64, help="Lines sent to a worker at once")
+    parser.add_argument("--workers", type=int, default=1, help="Processes, each holding its own model")
+    parser.add_argument("--threads-per-worker", type=int,
+                        help="TensorFlow threads of every worker, the cores divided by the workers by default")
+    parser.add_argument("--beam-width", type=int, default=1)
+    parser.add_argument("--quantization", choices=QUANTIZATION_MODES)
+    parser.add_argument("--shortlist", help="Vocabulary shortlist built by tools/build_shortlist.py")
+    parser.add_argument("--cache-db", help="SQLite translation cache shared by the workers")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Overwrite the output instead of continuing after its last line")
+    args = parser.parse_args()
+    if args.format is None:
+        extension = os.path.splitext(args.input)[1].lstrip(".").lower()
+        args.format = extension if extension in ("tsv", "jsonl") else "txt"
+
+    # Resume after the lines already written, every input line gives one output line
+    done = 0 if args.no_resume else count_complete_lines(args.output)
+    options = {"cache_db": args.cache_db, "quantization": args.quantization, "shortlist": args.shortlist}
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+
+    start = time.perf_counter()
+    translated = 0
+    with open(args.input, encoding="utf-8") as input_file, \
+            open(args.output, "w" if args.no_resume else "a", encoding="utf-8") as output_file:
+        lines = (line.rstrip("\n") for line in islice(input_file, done, None))
+
+        def write(batch, translations):
+            nonlocal translated
+            output_file.writelines(write_line(line, translation, args) for line, translation in zip(batch, translations))
+            # Everything written so far survives an interruption
+            output_file.flush()
+            translated += len(batch)
+            rate = translated / (time.perf_counter() - start)
+            print("\r{} lines translated ({:.1f} lines/s)".format(done + translated, rate), end="", file=sys.stderr)
+
+        if args.workers == 1:
+            init_worker(options, args.threads_per_worker)
+            for batch in batches(lines, args.batch_size):
+                write(batch, translate_texts([read_text(line, args) for line in batch], args.beam_width))
+        else:
+            # The parent never loads TensorFlow, so forked workers start clean
+            with multiprocessing.get_context("fork").Pool(args.workers, init_worker, (options, threads)) as pool:
+                # A bounded window of batches in flight keeps the memory flat, the
+                # results are written in input order
+                pending = deque()
+                for batch in batches(lines, args.batch_size):
+                    texts = [read_text(line, args) for line in batch]
+                    pending.append((batch, pool.apply_async(translate_texts, (texts, args.beam_width))))
+                    if len(pending) >= 2 * args.workers:
+                        batch, result = pending.popleft()
+                        write(batch, result.get())
+                while pending:
+                    batch, result = pending.popleft()
+                    write(batch, result.get())
+    print(file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()